@@ -0,0 +1,62 @@
+#!/usr/bin/env python
+# coding: utf-8
+# License: MIT
+# Import time of every zktools module, each in a fresh interpreter.
+# Fails (exit 1) if a module takes longer than the budget or drags in
+# one of the heavy third party stacks that should only load on use.
+#
+#   $> python -m benchmarks.bench_import [budget_ms]
+
+import sys
+import json
+import subprocess
+
+MODULES = ['zktools', 'zktools.store', 'zktools.httpclient',
+           'zktools.htmlmeta', 'zktools.iacr', 'zktools.gists',
+           'zktools.transcript', 'zktools.txtdoc', 'zktools.linkdoc',
+           'zktools.rssdump', 'zktools.scheduler', 'zktools.cli']
+# none of these may be imported as a side effect of importing zktools
+HEAVY = ['requests', 'urllib3', 'bs4', 'lxml', 'feedparser', 'eyed3',
+         'dateutil', 'IPython', 'multiprocessing']
+BUDGET_MS = 100
+REPEAT = 5
+
+PROBE = '''
+import sys, time, json
+t = time.perf_counter()
+import {module}
+ms = (time.perf_counter() - t) * 1000
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{'ms': ms, 'heavy': heavy}}))
+'''
+
+
+def probe(module):
+    # best of REPEAT fresh interpreters, so disk cache noise doesn't count
+    best = None
+    for _ in range(REPEAT):
+        out = subprocess.run(
+            [sys.executable, '-c', PROBE.format(module=module, heavy=HEAVY)],
+            check=True, capture_output=True, text=True).stdout
+        res = json.loads(out)
+        if best is None or res['ms'] < best['ms']:
+            best = res
+    return best
+
+
+def main(budget_ms=BUDGET_MS):
+    failed = False
+    for module in MODULES:
+        res = probe(module)
+        status = 'ok'
+        if res['heavy']:
+            status = f"FAIL imports {', '.join(res['heavy'])}"
+        elif res['ms'] > budget_ms:
+            status = f'FAIL over {budget_ms}ms'
+        failed = failed or status != 'ok'
+        print(f"{module:20} {res['ms']:8.1f}ms  {status}")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(*(float(_) for _ in sys.argv[1:2])))
@@ -0,0 +1,43 @@
+#!/usr/bin/env python
+# coding: utf-8
+# License: MIT
+# Benchmark MarkdownDoc.as_simple on synthetic show notes
+#
+#   $> python -m benchmarks.bench_markdowndoc [n_links ...]
+
+import sys
+import time
+
+from zktools.txtdoc import MarkdownDoc
+
+
+def synthetic_doc(n_links):
+    # a first line of twitter handles plus a bullet list of links,
+    # like the copy text we publish per episode
+    hosts = ['https://twitter.com/h{}', 'https://github.com/org/repo{}',
+             'https://eprint.iacr.org/2022/{}', 'https://example.com/post-{}']
+    first = ' and '.join(
+        f'[Guest {i}](https://twitter.com/guest{i})' for i in range(4))
+    lines = [f'bla bla {first} at DevConnect', '',
+             'Here are some links for this episode:']
+    for i in range(n_links):
+        url = hosts[i % len(hosts)].format(i)
+        lines.append(f'* [Link {i} | Title]({url})')
+    return '\n'.join(lines)
+
+
+def bench(n_links, repeat=3):
+    doc = synthetic_doc(n_links)
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        MarkdownDoc(doc).as_simple()
+        dt = time.perf_counter() - t
+        best = dt if best is None else min(best, dt)
+    return best
+
+
+if __name__ == "__main__":
+    sizes = [int(_) for _ in sys.argv[1:]] or [100, 1000, 10000]
+    for n in sizes:
+        print(f'{n:>7} links: {bench(n) * 1000:9.1f} ms')
@@ -1 +1,21 @@
-from . import txtdoc
+import logging
+import importlib
+
+# Submodules load on first use (zktools.txtdoc, zktools.rssdump, ...), so
+# `import zktools` stays cheap and pulls in no HTTP or parser stacks.
+__all__ = ['cli', 'gists', 'htmlmeta', 'httpclient', 'iacr', 'linkdoc',
+           'rssdump', 'scheduler', 'store', 'transcript', 'txtdoc']
+
+
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def setup_logging(level=logging.INFO, log_format='>> %(message)s'):
+    # For entry points only; library modules never configure logging
+    logging.basicConfig(level=level, format=log_format)
+    # Quiet down request API calls by default
+    logging.getLogger('urllib3').setLevel(logging.WARNING)
+    logging.getLogger('requests').setLevel(logging.WARNING)
@@ -0,0 +1,9 @@
+#!/usr/bin/env python
+# coding: utf-8
+# License: MIT
+# Author: Chris Ward <chris@zeroknowledge.fm>
+#   $> python -m zktools --help
+import sys
+from .cli import main
+
+sys.exit(main())
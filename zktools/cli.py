@@ -0,0 +1,299 @@
+#!/usr/bin/env python
+# coding: utf-8
+# License: MIT
+# Author: Chris Ward <chris@zeroknowledge.fm>
+# Command line entry points for all the tools
+__app_name__ = "zktools"
+__version__ = "0.3"
+'''
+0.1: archive, links, reformat, srt and gist subcommands
+0.2: schedule
+0.3: archive --years, bulk IACR mirror
+'''
+
+# Read from files (or stdin, also as '-') and write to stdout, so the tools
+# run in shell pipelines and cron:
+#
+#   $> python -m zktools archive https://feeds.fireside.fm/zeroknowledge/rss
+#   $> cat urls.txt | python -m zktools links --workers 8 --format md
+#   $> python -m zktools reformat notes.txt --format md > notes.md
+#   $> python -m zktools srt episode.txt --format vtt > episode.vtt
+#   $> python -m zktools srt --archive Feeds_..._Rss-out --workers 4
+#   $> python -m zktools gist 3f2a...:notes.md
+#   $> python -m zktools schedule feeds.txt --once --workers 8
+#   $> python -m zktools archive https://eprint.iacr.org/rss/rss.xml --years 2015-2022
+
+import sys
+import json
+import argparse
+import logging
+
+from . import setup_logging
+
+log = logging.getLogger(__name__)
+
+ZK_FEED = 'https://feeds.fireside.fm/zeroknowledge/rss'
+
+
+def _open_inputs(paths):
+    # file objects for each path, stdin for none or '-'
+    for path in paths or ['-']:
+        if path == '-':
+            yield sys.stdin
+        else:
+            with open(path, encoding='utf-8') as f:
+                yield f
+
+
+def _iter_lines(paths):
+    for f in _open_inputs(paths):
+        yield from f
+
+
+def _write_json(obj, out=None):
+    out = out or sys.stdout
+    out.write(json.dumps(obj, ensure_ascii=False) + '\n')
+
+
+def cmd_archive(args):
+    from . import rssdump
+    feeds = []
+    for url in args.feed_urls or [ZK_FEED]:
+        cls = rssdump.IACRFeedParser if args.iacr else rssdump.parser_for(url)
+        if args.years and not issubclass(cls, rssdump.IACRFeedParser):
+            # check every url before archiving any of them
+            log.error(f'--years mirrors IACR eprints only, not {url}')
+            return 2
+        feeds.append((url, cls))
+    for url, cls in feeds:
+        feed = cls(url, out_dir=args.out_dir)
+        if args.years:
+            feed.incremental = not args.full
+            _mirror(feed, args)
+            continue
+        filehashes = feed.save(max_workers=args.workers,
+                               max_per_host=args.max_per_host,
+                               incremental=not args.full)
+        if args.format == 'json':
+            _write_json({'feed': url, 'outpath': feed.outpath,
+                         'modified': filehashes is not None,
+                         'files': filehashes or {}})
+        else:
+            n = 'not modified' if filehashes is None else f'{len(filehashes)} files'
+            print(f'{url}\t{feed.outpath}\t{n}')
+    return 0
+
+
+def _mirror(feed, args):
+    # archive --years 2015-2022: bulk IACR mirror instead of the rss window
+    year_from, _, year_to = args.years.partition('-')
+    archived, failed = feed.mirror(
+        int(year_from), int(year_to or year_from), max_workers=args.workers,
+        rate=args.rate or 2)
+    if args.format == 'json':
+        _write_json({'feed': feed.rss_url, 'outpath': feed.outpath,
+                     'archived': archived, 'failed': failed})
+    else:
+        print(f'{feed.rss_url}\t{feed.outpath}\t{archived} papers, {failed} failed')
+
+
+def cmd_schedule(args):
+    # feeds file: one `feed_url [interval hours]` per line, # comments
+    from . import scheduler
+    sched = scheduler.FeedScheduler(
+        args.state, max_workers=args.workers,
+        max_per_host=args.max_per_host or 4, rate=args.rate)
+    for line in _iter_lines(args.files):
+        line = line.split('#')[0].split()
+        if not line:
+            continue
+        hours = float(line[1]) if len(line) > 1 else args.interval
+        sched.add(line[0], interval=hours * scheduler.HOUR,
+                  out_dir=args.out_dir)
+    if args.once:
+        for url, status in sched.run_once().items():
+            print(f'{url}\t{status}')
+        return 0
+    sched.run_forever()
+    return 0
+
+
+def cmd_links(args):
+    from .linkdoc import Links
+    urls = [_.strip() for _ in _iter_lines(args.files)]
+    urls = [_ for _ in urls if _ and not _.startswith('#')]
+    links = Links(urls, sort=args.sort).parse(
+        max_workers=args.workers, max_per_host=args.max_per_host,
+        use_cache=not args.no_cache)
+    # links.data is keyed by url id, in input order
+    for d_link in links.data.values():
+        if args.format == 'json':
+            _write_json(d_link)
+        elif args.format == 'md':
+            print(d_link['markdown'])
+        else:
+            print(d_link['string'])
+    return 0
+
+
+def cmd_reformat(args):
+    from .txtdoc import TextDoc
+    lines = TextDoc.iter_reformat(
+        _iter_lines(args.files), md=args.format == 'md',
+        max_line_len=args.max_line_len, use_cache=not args.no_cache,
+        max_workers=args.workers)
+    for line in lines:
+        print(line)
+    return 0
+
+
+def cmd_srt(args):
+    from . import transcript
+    if args.archive:
+        # batch: write .srt/.vtt next to every transcript of an archive
+        converted = transcript.convert_archive(
+            args.archive, formats=(args.format,),
+            max_workers=args.workers, force=args.force)
+        for path in converted:
+            print(path)
+        return 0
+    # one transcript per call; SRT cue numbers don't survive concatenation
+    if len(args.files) > 1:
+        log.error('srt converts one file at a time, use --archive for many')
+        return 2
+    for f in _open_inputs(args.files):
+        transcript.WRITERS[args.format](f, sys.stdout)
+    return 0
+
+
+def cmd_gist(args):
+    from . import gists
+    refs = [_.partition(':') for _ in args.gists]
+    loaded = gists.Gists.load_many(
+        [gist_id for gist_id, _, _ in refs], max_workers=args.workers,
+        use_cache=not args.no_cache, token=args.token)
+    for gist_id, _, filename in refs:
+        if args.format == 'json':
+            _write_json(loaded[gist_id])
+            continue
+        # no filename: every file of the gist, in order
+        for name in [filename] if filename else list(loaded[gist_id]['files']):
+            for chunk in gists.Gist(gist_id, name).iter_content():
+                sys.stdout.write(chunk)
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='zktools', description='Tools to manage zeroknowledge.fm')
+    parser.add_argument('--version', action='version',
+                        version=f'%(prog)s {__version__}')
+
+    # flags every subcommand takes
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument('-w', '--workers', type=int, default=1,
+                        help='parallel workers (default: 1)')
+    common.add_argument('-v', '--verbose', action='count', default=0,
+                        help='log to stderr; -vv for debug')
+    # only for the commands that read the link / gist caches
+    cache = argparse.ArgumentParser(add_help=False)
+    cache.add_argument('--cache-dir',
+                       help='cache folder (default: $ZKTOOLS_CACHE_DIR '
+                            'or ~/.cache/zktools)')
+    cache.add_argument('--no-cache', action='store_true',
+                       help='bypass the persistent caches')
+    http = argparse.ArgumentParser(add_help=False)
+    http.add_argument('--max-per-host', type=int,
+                      help='parallel requests to any one server (default: 4)')
+    http.add_argument('--rate', type=float,
+                      help='max requests per second, overall')
+
+    sub = parser.add_subparsers(dest='command', metavar='command')
+    sub.required = True
+
+    p = sub.add_parser('archive', parents=[common, http],
+                       help='backup rss feeds and their media')
+    p.add_argument('feed_urls', nargs='*', metavar='feed_url',
+                   help=f'default: {ZK_FEED}')
+    p.add_argument('--iacr', action='store_true',
+                   help='feed is an IACR eprint feed (auto for eprint.iacr.org)')
+    p.add_argument('-o', '--out-dir', default='./',
+                   help='where the {feed}-out folders go (default: ./)')
+    p.add_argument('--years', metavar='FROM[-TO]',
+                   help='IACR: mirror every eprint of these years, resumable')
+    p.add_argument('--full', action='store_true',
+                   help='walk every entry again, not only new or changed ones')
+    p.add_argument('-f', '--format', choices=['text', 'json'], default='text')
+    p.set_defaults(func=cmd_archive)
+
+    p = sub.add_parser('schedule', parents=[common, http],
+                       help='archive many feeds, each on its own interval')
+    p.add_argument('files', nargs='*',
+                   help='feeds, one `feed_url [hours]` per line (default: stdin)')
+    p.add_argument('--interval', type=float, default=24,
+                   help='hours between polls of a feed (default: 24)')
+    p.add_argument('--state', default='feeds.jsonl',
+                   help='per feed state (default: ./feeds.jsonl)')
+    p.add_argument('-o', '--out-dir', default='./',
+                   help='where the {feed}-out folders go (default: ./)')
+    p.add_argument('--once', action='store_true',
+                   help='poll the due feeds once and exit, eg. from cron')
+    p.set_defaults(func=cmd_schedule, workers=8)
+
+    p = sub.add_parser('links', parents=[common, cache, http],
+                       help='resolve urls (one per line) to titled links')
+    p.add_argument('files', nargs='*', help='default: stdin')
+    p.add_argument('--sort', action='store_true',
+                   help='sort and drop duplicate urls')
+    p.add_argument('-f', '--format', choices=['text', 'md', 'json'],
+                   default='text')
+    p.set_defaults(func=cmd_links)
+
+    p = sub.add_parser('reformat', parents=[common, cache, http],
+                       help='rewrite the links of a text document')
+    p.add_argument('files', nargs='*', help='default: stdin')
+    p.add_argument('--max-line-len', type=int, default=0)
+    p.add_argument('-f', '--format', choices=['text', 'md'], default='text')
+    p.set_defaults(func=cmd_reformat)
+
+    p = sub.add_parser('srt', parents=[common],
+                       help='convert transcripts to subtitles')
+    p.add_argument('files', nargs='*', help='default: stdin')
+    p.add_argument('--archive', metavar='DIR',
+                   help='convert every transcript of an rssdump folder')
+    p.add_argument('--force', action='store_true',
+                   help='with --archive, convert unchanged transcripts too')
+    p.add_argument('-f', '--format', choices=['srt', 'vtt'], default='srt')
+    p.set_defaults(func=cmd_srt)
+
+    p = sub.add_parser('gist', parents=[common, cache, http],
+                       help='print the files of GitHub gists')
+    p.add_argument('gists', nargs='+', metavar='gist_id[:filename]')
+    p.add_argument('--token', help='GitHub token (default: $GITHUB_TOKEN)')
+    p.add_argument('-f', '--format', choices=['text', 'json'], default='text')
+    p.set_defaults(func=cmd_gist)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    level = [logging.WARNING, logging.INFO, logging.DEBUG][min(args.verbose, 2)]
+    setup_logging(level)
+    if getattr(args, 'cache_dir', None):
+        from . import store
+        store.set_cache_dir(args.cache_dir)
+    if getattr(args, 'rate', None):
+        from . import httpclient
+        httpclient.configure(rate=args.rate)
+    try:
+        return args.func(args)
+    except BrokenPipeError:
+        # eg. `zktools links urls.txt | head`
+        sys.stderr.close()
+        return 1
+    except KeyboardInterrupt:
+        return 130
+
+
+if __name__ == "__main__":
+    sys.exit(main())
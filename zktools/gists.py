@@ -4,41 +4,149 @@
 # Author: Chris Ward <chris@zeroknowledge.fm>
 # Simple tool for extracting printable title from a list of links
 __app_name__ = "Gists"
-__version__ = "0.1"
+__version__ = "0.3"
 '''
 0.1: Play with Gists by GitHub
+0.2: Cache gists, revalidate with ETag; stream truncated files from raw_url
+0.3: Fetch lazily; Gists.load_many() for batches
 '''
 
 # DEBUG
 #from IPython.core.debugger import set_trace
 #######
 
+import os
 import re
-import requests
+import sys
+import time
+import codecs
+from concurrent.futures import ThreadPoolExecutor
+if __name__ == "__main__" and not __package__:
+    # run as a script (python zktools/gists.py): load as part of the
+    # zktools package, so the relative imports below work
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    __package__ = 'zktools'
+from . import httpclient
+from . import store
 
 import logging
-log_format = '>> %(message)s'
-logging.basicConfig(level=logging.DEBUG, format=log_format)
-log = logging.getLogger()
+log = logging.getLogger(__name__)
 
-def gist_json(gist_id):
-    _gist_call_api = f'https://api.github.com/gists/{gist_id}'
-    r = requests.get(_gist_call_api)
+GIST_API = 'https://api.github.com/gists/{}'
+RAW_CHUNK = 64 * 1024
+re_max_age = re.compile(r'max-age=(\d+)')
+
+# gist id -> api json loaded in this process (see Gists.load_many)
+_loaded = {}
+
+
+def _max_age(headers):
+    r = re_max_age.search(headers.get('Cache-Control', ''))
+    return int(r.group(1)) if r else 0
+
+
+def gist_json(gist_id, use_cache=True, token=None, ttl=None):
+    # The gist's API json. The last copy and its ETag are kept in the
+    # 'gists' cache. While that copy is younger than ttl seconds (default:
+    # the API's Cache-Control max-age) it is returned without a request;
+    # after that it is revalidated with If-None-Match. GitHub only lets a
+    # 304 off the rate limit when the request is authenticated, so without
+    # a token every revalidation still costs one of the 60 requests an
+    # hour. A token (default $GITHUB_TOKEN) lifts the limit to 5000.
+    cache = store.get_cache('gists') if use_cache else None
+    rec = cache.get(gist_id) if cache else None
+    if rec:
+        max_age = rec.get('max_age', 0) if ttl is None else ttl
+        if time.time() - rec.get('checked', 0) < max_age:
+            log.debug(f'Gist fresh in cache: {gist_id}')
+            return rec['json']
+    headers = {'Accept': 'application/vnd.github+json'}
+    token = token or os.environ.get('GITHUB_TOKEN')
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    if rec and rec.get('etag'):
+        headers['If-None-Match'] = rec['etag']
+
+    _gist_call_api = GIST_API.format(gist_id)
+    r = httpclient.get(_gist_call_api, headers=headers)
+    if r.status_code == 304 and rec:
+        log.debug(f'Gist not modified: {gist_id}')
+        cache.put(gist_id, dict(rec, checked=time.time(),
+                                max_age=_max_age(r.headers)))
+        return rec['json']
+    if not r.ok and rec:
+        # eg. rate limited; what we had is better than nothing
+        log.warning(f'Gist {gist_id}: HTTP {r.status_code}, using cached copy')
+        return rec['json']
     r_json = r.json()
+    if cache and r.ok:
+        cache.put(gist_id, {
+            'etag': r.headers.get('ETag'),
+            'json': r_json,
+            'checked': time.time(),
+            'max_age': _max_age(r.headers),
+        })
     return r_json
 
+
+def iter_raw(raw_url, chunk_size=RAW_CHUNK):
+    # Stream a gist file's full text from its raw_url
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    with httpclient.get_client().host_slot(raw_url):
+        with httpclient.get(raw_url, stream=True) as r:
+            r.raise_for_status()
+            for chunk in r.iter_content(chunk_size):
+                yield decoder.decode(chunk)
+    yield decoder.decode(b'', final=True)
+
+
+class Gists:
+    # Many gists at once
+    @staticmethod
+    def load_many(gist_ids, max_workers=8, use_cache=True, token=None,
+                  ttl=None):
+        # {gist id: api json}, fetched concurrently. Gist objects for these
+        # ids then read from memory instead of asking the API again.
+        gist_ids = list(dict.fromkeys(gist_ids))  # drop dups, keep order
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            jsons = pool.map(
+                lambda _id: gist_json(_id, use_cache, token, ttl), gist_ids)
+            loaded = dict(zip(gist_ids, jsons))
+        _loaded.update(loaded)
+        return loaded
+
+
 class Gist:
     _gist_id = None
     _gist_filename = None
+    _gist_data = None
     def __init__(self, gist_id, gist_filename):
         self._configure(gist_id, gist_filename)
 
     def _configure(self, gist_id, gist_filename):
+        # nothing is fetched until the content is first needed
         self._gist_id = gist_id
         self._gist_filename = gist_filename
-        self._gist_json = gist_json(gist_id)
 
-    def content(self):
+    @property
+    def _gist_json(self):
+        if self._gist_data is None:
+            self._gist_data = _loaded.get(self._gist_id)
+        if self._gist_data is None:
+            self._gist_data = gist_json(self._gist_id)
+            _loaded[self._gist_id] = self._gist_data
+        return self._gist_data
+
+    def iter_content(self, chunk_size=RAW_CHUNK):
         data = self._gist_json
-        gist = data['files'][self._gist_filename]['content']
+        gist_file = data['files'][self._gist_filename]
+        if gist_file.get('truncated'):
+            # the API cuts files off at ~1MB; raw_url has all of it
+            yield from iter_raw(gist_file['raw_url'], chunk_size)
+        else:
+            yield gist_file['content']
+
+    def content(self):
+        gist = ''.join(self.iter_content())
         return gist
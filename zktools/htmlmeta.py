@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# coding: utf-8
+# License: MIT
+# Author: Chris Ward <chris@zeroknowledge.fm>
+# Read a page's <title> and <meta> tags without downloading the whole page
+__app_name__ = "HtmlMeta"
+__version__ = "0.1"
+'''
+0.1: streaming <head> parser
+'''
+
+import re
+import codecs
+from html.parser import HTMLParser
+
+from . import httpclient
+
+import logging
+log = logging.getLogger(__name__)
+
+# stop reading after this many bytes even if </head> never showed up
+HEAD_BYTE_CAP = 256 * 1024
+READ_CHUNK = 8 * 1024
+
+re_charset = re.compile(r'charset=["\']?([\w-]+)', re.I)
+
+
+class PageMeta:
+    # <title> plus every <meta name|property=.. content=..> of a page;
+    # a name can repeat (eg. citation_author) so values are lists
+    def __init__(self, url, content_type=''):
+        self.url = url
+        self.content_type = content_type
+        self.title = None
+        self.meta = {}
+        # HTTP status the page came with (None = not fetched by us)
+        self.status = None
+
+    @property
+    def ok(self):
+        # False for error pages; their <title> is no title of the url
+        return self.status is None or 200 <= self.status < 300
+
+    def get(self, name, default=None):
+        values = self.meta.get(name)
+        return values[0] if values else default
+
+    def get_all(self, name):
+        return list(self.meta.get(name, []))
+
+    def is_html(self):
+        return 'html' in self.content_type or not self.content_type
+
+    def __repr__(self):
+        return f'PageMeta({self.url!r}, title={self.title!r})'
+
+
+class _HeadParser(HTMLParser):
+    def __init__(self, page):
+        super().__init__(convert_charrefs=True)
+        self.page = page
+        self.done = False
+        self._title = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'title' and self.page.title is None:
+            self._title = []
+        elif tag == 'meta':
+            attrs = dict(attrs)
+            name = attrs.get('name') or attrs.get('property')
+            if name and attrs.get('content') is not None:
+                self.page.meta.setdefault(name, []).append(attrs['content'])
+        elif tag == 'body':
+            self.done = True
+
+    def handle_endtag(self, tag):
+        if tag == 'title' and self._title is not None:
+            self.page.title = ''.join(self._title)
+            self._title = None
+        elif tag == 'head':
+            self.done = True
+
+    def handle_data(self, data):
+        if self._title is not None:
+            self._title.append(data)
+
+
+def parse_head(url, chunks, encoding='utf-8', content_type=''):
+    # Build a PageMeta from an iterable of byte chunks, stopping at
+    # </head> (or <body>) or after HEAD_BYTE_CAP bytes
+    page = PageMeta(url, content_type)
+    parser = _HeadParser(page)
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    n = 0
+    for chunk in chunks:
+        parser.feed(decoder.decode(chunk))
+        n += len(chunk)
+        if parser.done or n >= HEAD_BYTE_CAP:
+            break
+    return page
+
+
+def fetch_meta(url, **kwargs):
+    # GET url streaming, parse only its <head>, drop the connection after
+    client = httpclient.get_client()
+    with client.host_slot(url):
+        with client.get(url, stream=True, **kwargs) as r:
+            content_type = r.headers.get('Content-Type', '')
+            page = PageMeta(r.url, content_type)
+            page.status = r.status_code
+            if not page.is_html():
+                log.debug(f'Not html ({content_type}): {url}')
+                return page
+            m = re_charset.search(content_type)
+            encoding = m.group(1) if m else 'utf-8'
+            try:
+                codecs.lookup(encoding)
+            except LookupError:
+                encoding = 'utf-8'
+            page = parse_head(r.url, r.iter_content(READ_CHUNK),
+                              encoding, content_type)
+            page.status = r.status_code
+    return page
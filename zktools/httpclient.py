@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# coding: utf-8
+# License: MIT
+# Author: Chris Ward <chris@zeroknowledge.fm>
+# Shared HTTP client for all the tools
+__app_name__ = "HttpClient"
+__version__ = "0.1"
+'''
+0.1: pooled session, timeouts, retries, rate limit, per host limit
+'''
+
+import time
+import threading
+import contextlib
+from urllib.parse import urlsplit
+
+import logging
+log = logging.getLogger(__name__)
+
+# (connect, read) seconds; a stalled server no longer hangs the pipeline
+DEFAULT_TIMEOUT = (10, 60)
+RETRY_STATUS = (429, 500, 502, 503, 504)
+
+
+class RateLimiter:
+    # Global limit of `rate` requests per second, spaced out evenly
+    def __init__(self, rate):
+        self.interval = 1.0 / rate
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+class HostSlots:
+    # A BoundedSemaphore per host, made on first use. The shared client
+    # has one; a caller can keep its own on top for a tighter limit of
+    # its own, without touching everybody else's. None = no limit.
+    def __init__(self, max_per_host=None):
+        self.max_per_host = max_per_host
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def slot(self, url):
+        if not self.max_per_host:
+            return contextlib.nullcontext()
+        host = urlsplit(url).hostname or ''
+        with self._lock:
+            if host not in self._slots:
+                self._slots[host] = threading.BoundedSemaphore(
+                    self.max_per_host)
+            return self._slots[host]
+
+
+class HttpClient:
+    # One keep-alive requests.Session for every module; retries 429/5xx
+    # with exponential backoff (honouring Retry-After), applies a default
+    # timeout, an optional global rate limit and a per host concurrency cap.
+    def __init__(self, timeout=DEFAULT_TIMEOUT, retries=3, backoff=0.5,
+                 rate=None, max_per_host=4, pool_maxsize=32):
+        # requests is slow to import; load it with the first client
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        self.timeout = timeout
+        self.max_per_host = max_per_host
+        self._limiter = RateLimiter(rate) if rate else None
+        # fixed for the client's lifetime; configure() a new client to change
+        self._host_slots = HostSlots(max_per_host)
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=frozenset(['GET', 'HEAD']),
+            respect_retry_after_header=True,
+            raise_on_status=False)
+        adapter = HTTPAdapter(
+            pool_connections=pool_maxsize,
+            pool_maxsize=pool_maxsize,
+            max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def host_slot(self, url):
+        # Semaphore limiting concurrent requests against url's host
+        return self._host_slots.slot(url)
+
+    def request(self, method, url, **kwargs):
+        # NOTE: with stream=True the body is read after we return, so the
+        # caller holds host_slot(url) for as long as it consumes it
+        kwargs.setdefault('timeout', self.timeout)
+        if self._limiter:
+            self._limiter.wait()
+        if kwargs.get('stream'):
+            return self.session.request(method, url, **kwargs)
+        with self.host_slot(url):
+            return self.session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def head(self, url, **kwargs):
+        return self.request('HEAD', url, **kwargs)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def configure(**kwargs):
+    # Replace the shared client, eg. configure(rate=5, max_per_host=2);
+    # best done once, before any requests are made
+    global _client
+    with _client_lock:
+        _client = HttpClient(**kwargs)
+    return _client
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
+
+
+def get(url, **kwargs):
+    return get_client().get(url, **kwargs)
+
+
+def head(url, **kwargs):
+    return get_client().head(url, **kwargs)
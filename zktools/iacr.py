@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# coding: utf-8
+# License: MIT
+# Author: Chris Ward <chris@zeroknowledge.fm>
+# Metadata of IACR eprint papers
+__app_name__ = "IACR"
+__version__ = "0.2"
+'''
+0.1: one fetch, one parse per eprint; batch fetch
+0.2: list every eprint through the OAI-PMH endpoint
+'''
+
+import re
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+
+from . import htmlmeta
+from . import httpclient
+
+import logging
+log = logging.getLogger(__name__)
+
+# eprint.iacr.org/2022/509, ia.cr/2022/509, eprint.kobi.one/2022/509
+re_eprint_id = re.compile(
+    r'(?:eprint\.iacr\.org|ia\.cr|eprint\.kobi\.one)/(\d{4})/(\d+)', re.I)
+
+
+def eprint_id(url):
+    # '2022/509' for any eprint url, None if it is not one
+    r = re_eprint_id.search(url)
+    return f'{r.group(1)}/{r.group(2)}' if r else None
+
+
+def eprint_url(url_or_id):
+    _id = eprint_id(url_or_id) or url_or_id
+    return f'https://eprint.iacr.org/{_id}'
+
+
+class EprintMeta:
+    # Everything we read off an eprint page (its citation_* meta tags),
+    # parsed once and shared by all accessors
+    def __init__(self, url, meta=None, status=None):
+        self.url = url
+        self.meta = meta or {}
+        self.status = status
+
+    @classmethod
+    def from_page(cls, page):
+        return cls(page.url, page.meta, page.status)
+
+    @property
+    def ok(self):
+        # read off a 2xx page, not an error page; only those are cached
+        return self.status is None or 200 <= self.status < 300
+
+    @property
+    def id(self):
+        return eprint_id(self.url)
+
+    @property
+    def title(self):
+        return self.get('citation_title', '')
+
+    @property
+    def authors(self):
+        return self.get_all('citation_author')
+
+    def get(self, attr, default=None):
+        values = self.meta.get(attr)
+        return values[0] if values else default
+
+    def get_all(self, attr):
+        return list(self.meta.get(attr, []))
+
+    def as_dict(self):
+        return {'url': self.url, 'meta': self.meta, 'status': self.status}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['url'], data['meta'], data.get('status'))
+
+
+def fetch_eprint(url_or_id):
+    # One GET of the eprint page, its <head> parsed once
+    url = url_or_id if '://' in url_or_id else eprint_url(url_or_id)
+    page = htmlmeta.fetch_meta(url)
+    return EprintMeta.from_page(page)
+
+
+def fetch_many(urls_or_ids, max_workers=8):
+    # {url_or_id: EprintMeta} for many papers, fetched concurrently
+    # (the shared http client keeps per host limits)
+    urls_or_ids = list(urls_or_ids)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        metas = pool.map(fetch_eprint, urls_or_ids)
+        return dict(zip(urls_or_ids, metas))
+
+
+# OAI-PMH: the whole archive, page by page
+#   https://eprint.iacr.org/oai?verb=ListRecords&metadataPrefix=oai_dc
+OAI_URL = 'https://eprint.iacr.org/oai'
+_OAI = '{http://www.openarchives.org/OAI/2.0/}'
+_DC = '{http://purl.org/dc/elements/1.1/}'
+
+
+class OAIError(Exception):
+    # an <error code=".."> answer, eg. badResumptionToken once it expired
+    def __init__(self, code, message=''):
+        super().__init__(f'{code}: {message}')
+        self.code = code
+
+
+def list_records(token=None, from_date=None, until_date=None, client=None):
+    # One ListRecords page: ([record, ...], resumption token of the next
+    # page or None on the last one). Dates are YYYY-MM-DD datestamps, ie.
+    # when a record last changed, not when the paper came out.
+    if token:
+        params = {'verb': 'ListRecords', 'resumptionToken': token}
+    else:
+        params = {'verb': 'ListRecords', 'metadataPrefix': 'oai_dc'}
+        if from_date:
+            params['from'] = from_date
+        if until_date:
+            params['until'] = until_date
+    client = client or httpclient.get_client()
+    r = client.get(OAI_URL, params=params)
+    r.raise_for_status()
+    return parse_list_records(r.content)
+
+
+def parse_list_records(xml):
+    root = ET.fromstring(xml)
+    error = root.find(f'{_OAI}error')
+    if error is not None:
+        if error.get('code') == 'noRecordsMatch':
+            return [], None
+        raise OAIError(error.get('code'), (error.text or '').strip())
+    records = []
+    for rec in root.iter(f'{_OAI}record'):
+        record = _oai_record(rec)
+        if record:
+            records.append(record)
+    token = root.find(f'.//{_OAI}resumptionToken')
+    token = (token.text or '').strip() if token is not None else ''
+    return records, token or None
+
+
+def _oai_record(rec):
+    # An oai_dc record as a dict shaped like an eprint rss entry (id, link,
+    # title, ...), so it archives the same way; None if it was deleted
+    header = rec.find(f'{_OAI}header')
+    if header.get('status') == 'deleted':
+        return None
+    oai_id = header.findtext(f'{_OAI}identifier', '')
+    # oai:eprint.iacr.org:2022/509
+    url = eprint_url(oai_id.rsplit(':', 1)[-1])
+
+    def dc(name):
+        return [(_.text or '').strip() for _ in rec.iter(f'{_DC}{name}')]
+
+    title = dc('title')
+    date = dc('date')
+    summary = dc('description')
+    return {
+        'id': url,
+        'link': url,
+        'title': title[0] if title else '',
+        'authors': dc('creator'),
+        'published': date[0] if date else '',
+        'summary': summary[0] if summary else '',
+        'oai_identifier': oai_id,
+        'datestamp': header.findtext(f'{_OAI}datestamp', ''),
+    }
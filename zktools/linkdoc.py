@@ -17,24 +17,31 @@ __version__ = "0.1"
 # >> [Please Wait... | Cloudflare](https://www.rsaconference.com/usa/agenda/session/Proofs%20Without%20Evidence%20Assurance%20on%20the%20Blockchain%20and%20Other%20Applications) | rsaconference.com 
 # >> https://www.rsaconference.com/usa/agenda/session/Proofs%20Without%20Evidence%20Assurance%20on%20the%20Blockchain%20and%20Other%20Applications | Please Wait... | Cloudflare | rsaconference.com
 
-from IPython.core.debugger import set_trace
+# DEBUG
+#from IPython.core.debugger import set_trace
+#######
 
-from urllib.parse import urlsplit, urlunsplit, urlparse, parse_qs, unquote
+from urllib.parse import urlsplit, urlunsplit, urlparse, parse_qs, unquote, urljoin
+import os
 import re
-from lxml import html
-from bs4 import BeautifulSoup
+import sys
 import pprint
 import hashlib
-import base64
+from concurrent.futures import ThreadPoolExecutor
 
 import logging
-log_format = '>> %(message)s'
-logging.basicConfig(level=logging.DEBUG, format=log_format)
-log = logging.getLogger()
-
-import requests
-req_log = requests.logging.getLogger()
-req_log.setLevel(logging.WARNING)  # Quiet down request API calls from request by default
+log = logging.getLogger(__name__)
+
+if __name__ == "__main__" and not __package__:
+    # run as a script (python zktools/linkdoc.py): load as part of the
+    # zktools package, so the relative imports below work
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    __package__ = 'zktools'
+from . import httpclient
+from . import htmlmeta
+from . import iacr
+from . import store
 
 re_generic_url = re.compile(
         r'^(?:http|ftp)s?://' # http:// or https://
@@ -45,6 +52,110 @@ re_generic_url = re.compile(
         r'(?:/?|[/?]\S+)$', re.I) 
 
 
+DAY = 24 * 3600
+
+# url shorteners we expand before classifying a link
+SHORTENERS = {
+    't.co', 'bit.ly', 'buff.ly', 'ow.ly', 'tinyurl.com', 'goo.gl',
+    'lnkd.in', 'dlvr.it', 'trib.al', 'shorturl.at', 'rebrand.ly',
+}
+MAX_HOPS = 5
+
+
+def is_short_url(url):
+    return (urlsplit(url).hostname or '').lower() in SHORTENERS
+
+
+def expand_url(url, cache=None):
+    # Follow a shortener's redirects by hand, without downloading any
+    # page body, and only while we are still on a shortener
+    if cache is not None:
+        long_url = cache.get(url)
+        if long_url:
+            return long_url
+    long_url = url
+    for _ in range(MAX_HOPS):
+        if not is_short_url(long_url):
+            break
+        r = httpclient.head(long_url, allow_redirects=False)
+        if not r.is_redirect:
+            # some refuse HEAD; a GET we never read the body of will do.
+            # streamed requests don't take a host slot on their own
+            client = httpclient.get_client()
+            with client.host_slot(long_url):
+                with client.get(long_url, allow_redirects=False,
+                                stream=True) as r:
+                    pass
+        location = r.headers.get('Location')
+        if not r.is_redirect or not location:
+            break
+        long_url = urljoin(long_url, location)
+    if long_url != url:
+        log.info(f'Expanded {url} -> {long_url}')
+        if cache is not None:
+            # expansions never change, keep them forever
+            cache.put(url, long_url)
+    return long_url
+
+
+def expand_urls(urls, max_workers=8, use_cache=True):
+    # {short url: long url} for every shortener link in urls, resolved
+    # concurrently; the persistent 'shorturls' cache remembers them
+    cache = store.get_cache('shorturls') if use_cache else None
+    short_urls = sorted(set(u for u in urls if is_short_url(u)))
+    if not short_urls:
+        return {}
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        long_urls = pool.map(lambda u: expand_url(u, cache), short_urls)
+        return dict(zip(short_urls, long_urls))
+
+
+class LinkClassifier:
+    # Picks the Link class for a url from its hostname: the host and then
+    # each parent domain are looked up in a dict (www.github.com ->
+    # github.com). Hosts we can't parse out of the url fall back to one
+    # combined, precompiled pattern over every registered host/pattern.
+    def __init__(self, default):
+        self.default = default
+        self._by_host = {}
+        self._patterns = []  # [(regex str, cls)]
+        self._re = None
+        self._re_classes = {}
+
+    def register(self, cls, hosts=(), pattern=None):
+        for host in hosts:
+            self._by_host[host.lower()] = cls
+            self._patterns.append(
+                (r'^(?:\w+://)?(?:[^/\s]*\.)?' + re.escape(host) + r'(?:[:/?#\s]|$)', cls))
+        if pattern:
+            self._patterns.append((pattern, cls))
+        self._re = None  # recompile on next use
+        return cls
+
+    def _combined(self):
+        if self._re is None:
+            groups = []
+            self._re_classes = {}
+            for k, (pattern, cls) in enumerate(self._patterns):
+                groups.append(f'(?P<c{k}>{pattern})')
+                self._re_classes[f'c{k}'] = cls
+            self._re = re.compile('|'.join(groups), re.I)
+        return self._re
+
+    def classify(self, url):
+        host = (urlsplit(url).hostname or '').lower()
+        labels = host.split('.') if host else []
+        for k in range(len(labels)):
+            cls = self._by_host.get('.'.join(labels[k:]))
+            if cls:
+                return cls
+        if not host and self._patterns:
+            r = self._combined().search(url)
+            if r:
+                return self._re_classes[r.lastgroup]
+        return self.default
+
+
 def hash_url(url, length=10):
     length = 0 if length is None else length
     _ = url.lower()
@@ -64,31 +175,31 @@ class Links:
             urls = re.sub(r'[\n\r]+', '\n', urls.strip())
             urls = [x.strip() for x in urls.split('\n')]
         self.data = {}
+        self._cache = None
+        self._expanded = {}
+        self._host_slots = httpclient.HostSlots()
         # sort and remove exact dups
         self._urls = sorted(set(urls)) if sort else urls
 
-    def parse(self):
-        for k, url in enumerate(self._urls):
-            if re.search('t.co/', url):  # expand the url
-                new_url = requests.get(url).history[-1].headers['Location'] 
-                log.info('Expanded {url} -> {new_url}')
-                url = new_url
-
-            if re.search('github.com', url):
-                d_link = GithubLink(url).parse().data
-            elif re.search('twitter.com', url):
-                d_link = TwitterLink(url).parse().data
-            elif re.search('zeroknowledge.fm', url):
-                d_link = ZeroKnowledgeFMLink(url).parse().data
-            elif re.search('youtu\.?be(.com)?', url):
-                d_link = YoutubeLink(url).parse().data
-            elif re.search('iacr.org|ia.cr|kobi.one', url):
-                d_link = IACRLink(url).parse().data
-            elif re.search('0xparc.org', url):
-                d_link = ZXParcLink(url).parse().data
-            else:
-                d_link = Link(url).parse().data
+    def parse(self, max_workers=1, max_per_host=None, use_cache=True,
+              expand_workers=8):
+        # Resolve every url; with max_workers > 1 urls are resolved in
+        # parallel, with at most max_per_host requests to any one domain.
+        # Results keep the input order either way. Resolved links are kept
+        # in the persistent link cache, use_cache=False bypasses it.
+        # Short links are expanded first, expand_workers at a time.
+        self._cache = store.get_cache('links') if use_cache else None
+        # our own limit, on top of the shared client's
+        self._host_slots = httpclient.HostSlots(max_per_host)
+        # expand all t.co & co. links in one batch up front
+        self._expanded = expand_urls(self._urls, expand_workers, use_cache)
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                d_links = list(pool.map(self._parse_url, self._urls))
+        else:
+            d_links = [self._parse_url(url) for url in self._urls]
 
+        for k, d_link in enumerate(d_links):
             url = self._urls[k] = d_link['url']
 
             hurl = hash_url(url)
@@ -98,12 +209,36 @@ class Links:
             self.data[_id] = d_link
         return self
 
+    def _parse_url(self, url):
+        url = self._expanded.get(url, url)
+
+        cls = self._link_class(url)
+        if self._cache is not None:
+            d_link = self._cache.get(hash_url(url), cls.cache_ttl)
+            if d_link:
+                log.debug(f'Cached: {url}')
+                return d_link
+        with self._host_slots.slot(url):
+            link = cls(url).parse()
+        d_link = link.data
+        if self._cache is not None and link.fetched_ok():
+            # an error page (403, 429, 5xx, ...) is not cached, else it
+            # would stick for cache_ttl (forever for IACR papers)
+            self._cache.put(hash_url(url), d_link)
+        return d_link
+
+    def _link_class(self, url):
+        return link_classifier.classify(url)
+
     def pprint(self):
         pprint.PrettyPrinter(indent=2).pprint(self.data)
 
 
 class Link:
     _r = None
+    _meta = None
+    # how long parsed data stays fresh in the link cache (None = forever)
+    cache_ttl = 7 * DAY
     def __init__(self, url, from_path=False):
         self._from_path = from_path
         self.url = url.strip().rstrip('/')
@@ -146,6 +281,14 @@ class Link:
         })
         return self
 
+    def fetched_ok(self):
+        # every page we read for this link came back 2xx
+        if self._meta is not None and not self._meta.ok:
+            return False
+        if self._r is not None and not 200 <= self._r.status_code < 300:
+            return False
+        return True
+
     def get_string(self, url, title, authors, pub):
         parts = [x for x in (url, title, authors, pub) if x]
         string = ' | '.join(parts)
@@ -192,7 +335,17 @@ class Link:
         return self._scrape_html_title()
 
     def _scrape_html_title(self):
-        self._r = requests.get(self.url) if not self._r else self._r  # try loading cached
+        # og:title or <title>, read from the page's <head> only
+        self._meta = htmlmeta.fetch_meta(self.url) if not self._meta else self._meta  # try loading cached
+        title = self._meta.get('og:title') or self._meta.title
+        if title is None and self._meta.is_html():
+            title = self._soup_html_title()
+        return title or ''
+
+    def _soup_html_title(self):
+        # fallback: parse the whole page
+        from bs4 import BeautifulSoup
+        self._r = httpclient.get(self.url) if not self._r else self._r  # try loading cached
         soup = BeautifulSoup(self._r.content, 'html.parser')
         try:
             title = soup.find_all(attrs={'property': 'og:title'})[0].get('content')
@@ -205,6 +358,8 @@ class Link:
 
 
 class ZXParcLink(Link):
+    cache_ttl = None  # title comes from the url
+
     def get_title(self):
         title = self._get_title_from_url()
         return title
@@ -212,6 +367,8 @@ class ZXParcLink(Link):
 
 # NOTE: in 'tools' category (all github links) drop ` | {pub}`
 class GithubLink(Link):
+    cache_ttl = 3 * DAY  # releases move
+
     def get_title(self):
         title = self._scrape_title()
         title = re.sub(r'·', '|', title)
@@ -237,6 +394,8 @@ class GithubLink(Link):
 
 
 class TwitterLink(Link):
+    cache_ttl = None  # nothing is fetched
+
     def get_title(self):
         title = self.data['title_url']
         return title
@@ -260,6 +419,8 @@ class TwitterLink(Link):
 
 
 class ZeroKnowledgeFMLink(Link):
+    cache_ttl = 30 * DAY
+
     def get_title(self):
         title = self._scrape_title()
         title = re.sub('Episode', 'Ep', title)
@@ -275,6 +436,8 @@ class ZeroKnowledgeFMLink(Link):
         return string
 
 class YoutubeLink(Link):
+    cache_ttl = 30 * DAY
+
     def get_title(self):
         title = self._scrape_yt_title()
         return title
@@ -316,7 +479,7 @@ class YoutubeLink(Link):
             "format": "json",
             "url": self.url}
         _url = "https://www.youtube.com/oembed"
-        self._r = requests.get(_url, params=params) if not self._r else self._r  # try loading cached
+        self._r = httpclient.get(_url, params=params) if not self._r else self._r  # try loading cached
         if not self._r:
             title = '--No Title Found--'
         else:
@@ -335,6 +498,9 @@ class YoutubeLink(Link):
 
 
 class IACRLink(Link):
+    cache_ttl = None  # published papers keep their title and authors
+    _eprint_meta = None
+
     def __init__(self, url, from_path=True):
         new_url = re.sub('eprint\.kobi\.one', 'ia.cr', url, re.I)
         new_url = re.sub('eprint\.iacr\.org', 'ia.cr', url, re.I)
@@ -365,12 +531,15 @@ class IACRLink(Link):
         #return f'{url} | {title} by {authors} | IACR - {ed}'
 
     def _scrape_iacr_param(self, attr):
-        attrs = {'name': attr}
-        self._r = requests.get(self.url) if not self._r else self._r  # try loading cached
-        soup = BeautifulSoup(self._r.content, 'html.parser')
-        _items = soup.find_all(attrs=attrs)
-        items = [x.get('content') for x in _items]
-        return items
+        return self._eprint().get_all(attr)
+
+    def _eprint(self):
+        # the page is fetched and parsed once; title, authors and any
+        # citation_* attribute all read from the same EprintMeta
+        if self._eprint_meta is None:
+            self._meta = htmlmeta.fetch_meta(self.url) if not self._meta else self._meta  # try loading cached
+            self._eprint_meta = iacr.EprintMeta.from_page(self._meta)
+        return self._eprint_meta
 
     def get_markdown(self, url, title, authors, pub):
         edition = self.title_url.replace(' ', '/')
@@ -378,5 +547,13 @@ class IACRLink(Link):
         #string = f"[Paper {edition}: {title}]({url}) by {authors} | {pub}"
         return string
 
+link_classifier = LinkClassifier(default=Link)
+link_classifier.register(GithubLink, ['github.com'])
+link_classifier.register(TwitterLink, ['twitter.com'])
+link_classifier.register(ZeroKnowledgeFMLink, ['zeroknowledge.fm'])
+link_classifier.register(YoutubeLink, ['youtube.com', 'youtu.be'])
+link_classifier.register(IACRLink, ['iacr.org', 'ia.cr', 'kobi.one'])
+link_classifier.register(ZXParcLink, ['0xparc.org'])
+
 if __name__ == "__main__":
     print ("HELLO WORLD")
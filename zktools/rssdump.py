@@ -18,20 +18,27 @@ from datetime import date
 import os
 import re
 import json
-import requests
 import sys
-from dateutil import parser as dtparse
-import feedparser  # // pip install feedparser
-import eyed3  # // pip install eyed3
+# feedparser, eyed3 and dateutil are imported where they are used;
+# they are slow to load and not needed to import this module
+#  pip install feedparser eyed3 python-dateutil
 
 import hashlib
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
 import logging
-log_format = ' > %(message)s'
-logging.basicConfig(level=logging.DEBUG, format=log_format)
-log = logging.getLogger()
-
-# quiet down a little...
-logging.getLogger("requests").setLevel(logging.WARNING)
+if __name__ == "__main__" and not __package__:
+    # run as a script (python zktools/rssdump.py): load as part of the
+    # zktools package, so the relative imports below work
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    __package__ = 'zktools'
+from . import httpclient
+from . import iacr
+from .store import JsonlStore
+log = logging.getLogger(__name__)
+
+# read/write block size for streamed downloads and hashing
+CHUNK_SIZE = 64 * 1024
 
 TODAY_ISO = date.today().isoformat()
 TODAY_ISO_NAME = TODAY_ISO.replace('-', '')
@@ -45,10 +52,14 @@ TODAY_ISO_NAME = TODAY_ISO.replace('-', '')
 
 
 class FeedParser:
-    def __init__(self, rss_url, quiet=True):
-        log_lvl = logging.INFO if quiet else logging.DEBUG
-        log.setLevel(log_lvl)
-        log.debug(f'Setting log level: {log_lvl}')
+    # concurrency default for save(); max_workers=1 walks entries in order
+    max_workers = 1
+    # skip entries archived before, unchanged (see entries.jsonl)
+    incremental = True
+
+    def __init__(self, rss_url, quiet=True, out_dir='./'):
+        # quiet is kept for old callers only; log levels are up to the
+        # entry point (zktools.setup_logging)
 
         # FIXME: move to .set_outdir()
         self.rss_url = rss_url
@@ -56,7 +67,7 @@ class FeedParser:
         # override whatever tempfile.gettempdir() offers .... FIXME cleanup
         # import tempfile
         # tmp_dir = tempfile.gettempdir() # prints the current temporary dir
-        self.tmp_dir = './'
+        self.tmp_dir = out_dir
         url_name = self._autoname(rss_url)
         self.outpath = os.path.join(self.tmp_dir, f'{url_name}-out')
         log.debug(f'Saving to {self.outpath}')
@@ -65,6 +76,24 @@ class FeedParser:
             # FIXME: redudant? since below we makedirs again?
             os.makedirs(self.outpath)
 
+        # path -> size, mtime, url and sha256 of every file we archived;
+        # lets reruns skip re-hashing files that did not change on disk
+        self.manifest = JsonlStore(os.path.join(self.outpath, 'manifest.jsonl'))
+        # url -> ETag / Last-Modified / Content-Length from the last 200;
+        # replayed as conditional request headers on the next fetch
+        self.validators = JsonlStore(
+            os.path.join(self.outpath, 'validators.jsonl'))
+        # mp3 path -> sha256 it was read at + images extracted from its tag
+        self.artwork = JsonlStore(os.path.join(self.outpath, 'artwork.jsonl'))
+        # entry guid -> sha256 of the entry json + the files archived for it;
+        # a rerun only walks new or changed entries
+        self.entries = JsonlStore(os.path.join(self.outpath, 'entries.jsonl'))
+
+        # shared keep-alive pool, timeouts, retries and per host limits
+        self.http = httpclient.get_client()
+        # our own per host limit on top of the client's, see save()
+        self._host_slots = httpclient.HostSlots()
+
     def _autoname(self, name, prefix=None, ext=None, x_http=True):
         # Make names readable, for humans and machines
         _name = name.strip()
@@ -89,11 +118,36 @@ class FeedParser:
             # read file in chunks and update hash
             chunk = 0
             while chunk != b'':
-                chunk = file.read(1024)
+                chunk = file.read(CHUNK_SIZE)
                 h_sha256.update(chunk)
         # return the hex digest
         return h_sha256.hexdigest()
 
+    def _manifest_key(self, filename):
+        return os.path.relpath(filename, self.outpath)
+
+    def _record(self, filename, url, sha256):
+        # Remember a file's hash along with the stat it was taken at
+        st = os.stat(filename)
+        self.manifest.put(self._manifest_key(filename), {
+            'size': st.st_size,
+            'mtime': st.st_mtime_ns,
+            'url': url,
+            'sha256': sha256,
+        })
+
+    def cached_hash(self, filename, url=None):
+        # sha256 of a file on disk; the manifest is trusted while the file's
+        # size and mtime are unchanged, otherwise it is hashed again
+        rec = self.manifest.get(self._manifest_key(filename))
+        st = os.stat(filename)
+        if rec and rec['size'] == st.st_size and rec['mtime'] == st.st_mtime_ns:
+            return rec['sha256']
+        sha256 = self.hash_file(filename)
+        url = url or (rec['url'] if rec else None)
+        self._record(filename, url, sha256)
+        return sha256
+
     def dump_file(self, data, save_as):
         log.debug(f'Saving data to file: {save_as}')
         # log.debug(f'data: {data}')
@@ -102,141 +156,385 @@ class FeedParser:
         if save_path:
             if not os.path.exists(save_path):
                 log.debug(f"Making dir: {save_path}")
-                os.makedirs(save_path)
+                os.makedirs(save_path, exist_ok=True)
+
+            if isinstance(data, bytes):
+                # raw payloads (eg. the feed xml) are written as is
+                with open(save_as, 'wb') as f:
+                    f.write(data)
+                    log.debug(f'File saved: {save_as}')
+                return
 
             with open(save_as, 'w') as f:
                 try:
-                    json.dump(data, f)
-                    print(f'JSON dumped: {save_as}')
+                    # default=str: eg. the bozo_exception of a malformed feed
+                    json.dump(data, f, default=str)
+                    log.debug(f'JSON dumped: {save_as}')
                 except Exception as error:
                     # FIXME: catch proper exceptions; this might cover issues
                     log.debug(error)
                     with open(save_as, 'w') as f:
                         f.write(data.text)
-                        print(f'File saved: {save_as}')
+                        log.debug(f'File saved: {save_as}')
         # FIXME: RETURN FILE HASH
         return
 
-    def download(self, url, save_as='', overwrite=False):
+    def _conditional_headers(self, url):
+        # If-None-Match / If-Modified-Since for a url we fetched before
+        rec = self.validators.get(url) or {}
+        headers = {}
+        if not rec.get('complete', True):
+            # validators of a download that never finished
+            return headers
+        if rec.get('etag'):
+            headers['If-None-Match'] = rec['etag']
+        if rec.get('last_modified'):
+            headers['If-Modified-Since'] = rec['last_modified']
+        return headers
+
+    def _range_headers(self, url, offset):
+        # Range / If-Range to resume a .part file at offset; only possible
+        # when we know the validator of the response the part came from,
+        # otherwise the server could hand us the tail of another file
+        rec = self.validators.get(url) or {}
+        if rec.get('complete', True):
+            return {}
+        if_range = rec.get('etag') or rec.get('last_modified')
+        if not if_range:
+            return {}
+        return {'Range': f'bytes={offset}-', 'If-Range': if_range}
+
+    def _remember_validators(self, url, resp, complete=True):
+        rec = {
+            'etag': resp.headers.get('ETag'),
+            'last_modified': resp.headers.get('Last-Modified'),
+            'content_length': resp.headers.get('Content-Length'),
+            'complete': complete,
+        }
+        if rec['etag'] or rec['last_modified']:
+            self.validators.put(url, rec)
+
+    def download(self, url, save_as='', overwrite=False, _retry=True):
         # Download a url and save the result to disk
         save_as = save_as or self._autoname(url)
         save_path = os.path.dirname(save_as)
         path_exists = os.path.exists(save_as)
+        part_path = f'{save_as}.part'
 
         log.info(f'Downloading {url}')
         log.debug(f'... as > {save_as}')
         if path_exists and not overwrite:
             log.debug(f" ... skpping, cached: {save_as}")
+            return self.cached_hash(save_as, url)
+
+        if not os.path.exists(save_path):
+            # FIXME: redudant? since below we makedirs again?
+            os.makedirs(save_path, exist_ok=True)
+        if os.path.exists(part_path):
+            # resume an interrupted download
+            headers = self._range_headers(url, os.path.getsize(part_path))
+        elif path_exists:
+            # only revalidate when we still have the file a 304 points at
+            headers = self._conditional_headers(url)
         else:
-            if not os.path.exists(save_path):
-                # FIXME: redudant? since below we makedirs again?
-                os.makedirs(save_path)
-            resp = requests.get(url)
-            with open(save_as, "wb") as f:
-                # opening a file handler to create new file
-                f.write(resp.content)  # writing content to file
-        return self.hash_file(save_as)
-
-    def _walk_entries(self, entries):
+            headers = {}
+
+        with self._host_slots.slot(url), self.http.host_slot(url):
+            with self.http.get(url, headers=headers, stream=True) as resp:
+                if resp.status_code == 304:
+                    log.debug(f" ... not modified: {save_as}")
+                    return self.cached_hash(save_as, url)
+                if resp.status_code != 416:
+                    # don't archive a 404 page as the file itself
+                    resp.raise_for_status()
+                    sha256 = self._stream_to_file(url, resp, save_as)
+                    self._remember_validators(url, resp)
+                    return sha256
+        # 416: the part does not fit the remote file anymore; start over,
+        # once. Without a part we didn't send a Range, so a retry won't help.
+        if not _retry or not os.path.exists(part_path):
+            raise IOError(f'HTTP 416 Range Not Satisfiable: {url}')
+        log.debug(f" ... dropping stale {part_path}")
+        os.remove(part_path)
+        return self.download(url, save_as, overwrite, _retry=False)
+
+    def _hash_part(self, part_path, h_sha256):
+        # feed the bytes we already have into the running hash
+        with open(part_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                h_sha256.update(chunk)
+        return os.path.getsize(part_path)
+
+    def _expected_size(self, resp, offset):
+        # Total size the finished file must have, None if unknown
+        if resp.status_code == 206:
+            # Content-Range: bytes 100-999/1000
+            m = re.match(r'bytes (\d+)-\d+/(\d+)',
+                         resp.headers.get('Content-Range', ''))
+            if not m or int(m.group(1)) != offset:
+                raise IOError(f'Unexpected Content-Range from {resp.url}')
+            return int(m.group(2))
+        if resp.headers.get('Content-Encoding', 'identity') != 'identity':
+            # Content-Length counts encoded bytes, we store decoded ones
+            return None
+        length = resp.headers.get('Content-Length')
+        return int(length) if length else None
+
+    def _stream_to_file(self, url, resp, save_as):
+        # Stream the response body into save_as.part, hashing chunks as
+        # they arrive; memory use stays at one chunk. A 206 appends to the
+        # part left by an earlier run. The file is only renamed to its
+        # final name once it has the size the server announced; on any
+        # error the part stays behind for the next run to resume.
+        part_path = f'{save_as}.part'
+        h_sha256 = hashlib.sha256()
+        if resp.status_code == 206:
+            offset = self._hash_part(part_path, h_sha256)
+            log.info(f'Resuming {url} at byte {offset}')
+            mode = 'ab'
+        else:
+            offset = 0
+            mode = 'wb'
+            # remember what the part belongs to, see _range_headers
+            self._remember_validators(url, resp, complete=False)
+        expected = self._expected_size(resp, offset)
+
+        with open(part_path, mode) as f:
+            for chunk in resp.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                h_sha256.update(chunk)
+
+        size = os.path.getsize(part_path)
+        if expected is not None and size != expected:
+            raise IOError(
+                f'Incomplete download of {url}: {size} of {expected} bytes, '
+                f'keeping {part_path}')
+        os.replace(part_path, save_as)
+        sha256 = h_sha256.hexdigest()
+        self._record(save_as, url, sha256)
+        return sha256
+
+    def _walk_entries(self, entries, max_workers=1):
+        # Archive every entry; with max_workers > 1 entries are fetched in
+        # parallel, results are still merged in feed order
+        if max_workers > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as pool:
+                results = list(pool.map(self._process_entry, entries))
+        else:
+            results = [self._process_entry(i) for i in entries]
+        return self._merge_entries(entries, results)
+
+    def _merge_entries(self, entries, results):
         filehashes = {}
-        for i in entries:
-            pub_dt = dtparse.parse(i['published']).strftime('%Y%m%d')
-            title = i['title']
-            fn = self._autoname(f'{title}')
-            fn_path = os.path.join(self.outpath, fn)
-            fn_json = f'{fn_path}/{pub_dt}_{fn}.json'
-            fn_mp3 = f'{fn_path}/{pub_dt}_{fn}.mp3'
-            fn_img = f'{fn_path}/{pub_dt}_{fn}'  # add ext later
-            fn_tra = f'{fn_path}/{pub_dt}_{fn}.txt'
-            fn_ep_img = f'{fn_path}/{pub_dt}_{fn}'
-
-            # save the entry as a json
-            self.dump_file(i, fn_json)
-
-            # save episode mp3
-            urls = [_['href'] for _ in i['links'] if _['rel'] == 'enclosure']
-            mp3_url = urls[0] if len(urls) > 0 else None
-            mp3_sha256 = self.download(mp3_url, fn_mp3)
-
-            # save episode cover image
-            # 'image': {'href': 'https://.../cover.jpg?v=10'}
-            img_url = i['image'].get('href', '').split('?')[0]
-            img_ext = img_url.split('.')[-1] or 'JPG'
-            fn_img = fn_img + '.' + img_ext
-            img_sha256 = self.download(img_url, fn_img)
-
-            # Save transcript 'podcast_transcript'
-            # 'podcast_transcript':
-            # {'url': 'https://.../transcript.txt', 'type': 'text/plain'}
-            try:
-                tra_url = i['podcast_transcript'].get('url', '').split('?')[0]
-            except KeyError:
-                log.error(
-                    f'^^^ ERR ^^^ Missing key for {title}: podcast_transcript')
-            else:
-                tra_sha256 = self.download(tra_url, fn_tra)
-
-            # extract out the images stored in the mp3 itself
-            # (there is other stuff in there to....)
-            # _log = eyed3.utils.log
-            # _log.setLevel(logging.WARN)
-            # Override the module's logging defaults;
-            # it's a bit too noisy, we quiet it down here.
-            eyed3.log.setLevel(logging.WARN)
-            # print ("!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
-            audio_file = eyed3.load(fn_mp3)
-            # print ("!!!!!!!!!!!!!!!!!!!!!!!!!!!!")
-            # artist_name = audio_file.tag.artist
-            k = 0
-            for image in audio_file.tag.images:
+        for _hashes in results:
+            filehashes.update(_hashes)
+
+        k = len(entries)
+        log.info(f'{k} entries.')
+        return filehashes
+
+    def _entry_key(self, i):
+        # (guid, sha256 of the entry's json); any edit to the entry in the
+        # feed changes the hash and gets it archived again
+        guid = i.get('id') or i.get('link') or i.get('title')
+        data = json.dumps(i, sort_keys=True, default=str)
+        return guid, hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+    def _process_entry(self, i):
+        # _walk_entry(i), unless this very entry was archived before; then
+        # its file hashes come from entries.jsonl without touching disk.
+        # An entry is only recorded once all its files made it.
+        guid, sha256 = self._entry_key(i)
+        rec = self.entries.get(guid)
+        if self.incremental and rec and rec['sha256'] == sha256:
+            log.debug(f"... skipping entry {guid} (unchanged)")
+            return {os.path.join(self.outpath, k): v
+                    for k, v in rec['files'].items()}
+        filehashes = self._walk_entry(i)
+        self.entries.put(guid, {
+            'sha256': sha256,
+            'files': {self._manifest_key(k): v for k, v in filehashes.items()},
+        })
+        return filehashes
+
+    def _walk_entry(self, i):
+        # Archive a single rss entry; returns {path: {'url', 'sha256'}}
+        from dateutil import parser as dtparse
+        pub_dt = dtparse.parse(i['published']).strftime('%Y%m%d')
+        title = i['title']
+        fn = self._autoname(f'{title}')
+        fn_path = os.path.join(self.outpath, fn)
+        fn_json = f'{fn_path}/{pub_dt}_{fn}.json'
+        fn_mp3 = f'{fn_path}/{pub_dt}_{fn}.mp3'
+        fn_img = f'{fn_path}/{pub_dt}_{fn}'  # add ext later
+        fn_tra = f'{fn_path}/{pub_dt}_{fn}.txt'
+        fn_ep_img = f'{fn_path}/{pub_dt}_{fn}'
+
+        # save the entry as a json
+        self.dump_file(i, fn_json)
+
+        # save episode mp3
+        urls = [_['href'] for _ in i['links'] if _['rel'] == 'enclosure']
+        mp3_url = urls[0] if len(urls) > 0 else None
+        mp3_sha256 = self.download(mp3_url, fn_mp3)
+
+        # save episode cover image
+        # 'image': {'href': 'https://.../cover.jpg?v=10'}
+        img_url = i['image'].get('href', '').split('?')[0]
+        img_ext = img_url.split('.')[-1] or 'JPG'
+        fn_img = fn_img + '.' + img_ext
+        img_sha256 = self.download(img_url, fn_img)
+
+        # Save transcript 'podcast_transcript'
+        # 'podcast_transcript':
+        # {'url': 'https://.../transcript.txt', 'type': 'text/plain'}
+        tra_url = tra_sha256 = None
+        try:
+            tra_url = i['podcast_transcript'].get('url', '').split('?')[0]
+        except KeyError:
+            log.error(
+                f'^^^ ERR ^^^ Missing key for {title}: podcast_transcript')
+        else:
+            tra_sha256 = self.download(tra_url, fn_tra)
+
+        # extract out the images stored in the mp3 itself
+        # (there is other stuff in there to....)
+        self._extract_artwork(fn_mp3, mp3_sha256, fn_ep_img)
+
+        filehashes = {
+                fn_mp3: {'url': mp3_url, 'sha256': mp3_sha256},
+                fn_img: {'url': img_url, 'sha256': img_sha256},
+                # add images extracted from mp3?
+        }
+        if tra_url:
+            filehashes[fn_tra] = {'url': tra_url, 'sha256': tra_sha256}
+        return filehashes
+
+    def _extract_artwork(self, fn_mp3, mp3_sha256, fn_ep_img):
+        # Write the images embedded in the mp3's ID3 tag next to it, as
+        # {fn_ep_img}_{k}.jpg. The artwork index remembers which mp3 hash
+        # we extracted from, so unchanged episodes skip tag parsing.
+        key = self._manifest_key(fn_mp3)
+        rec = self.artwork.get(key)
+        if rec and rec['sha256'] == mp3_sha256 and all(
+                os.path.exists(_) for _ in rec['images']):
+            log.debug(f"... skipping artwork of {fn_mp3} (cached)")
+            return rec['images']
+
+        import eyed3
+        import eyed3.id3
+        # Override the module's logging defaults;
+        # it's a bit too noisy, we quiet it down here.
+        eyed3.log.setLevel(logging.WARN)
+        # parse only the tag (head of the file), not the mpeg audio frames
+        # the way eyed3.load() does
+        tag = eyed3.id3.Tag()
+        images = []
+        if tag.parse(fn_mp3):
+            # artist_name = tag.artist
+            for k, image in enumerate(tag.images):
                 img_path = f"{fn_ep_img}_{k}.jpg"
+                images.append(img_path)
                 if os.path.exists(img_path):
                     log.debug(f"... skipping {img_path} (cached)")
                     continue
                 # else
                 log.info("Writing image")
                 log.debug(f"... {img_path}")
-                img_file = open(img_path, "wb")
-                k += 1
-                img_file.write(image.image_data)
-                img_file.close()
-
-            filehashes = {
-                    fn_mp3: {'url': mp3_url, 'sha256': mp3_sha256},
-                    fn_img: {'url': img_url, 'sha256': img_sha256},
-                    fn_tra: {'url': tra_url, 'sha256': tra_sha256},
-                    # add images extracted from mp3?
-            }
+                with open(img_path, "wb") as img_file:
+                    img_file.write(image.image_data)
+        self.artwork.put(key, {'sha256': mp3_sha256, 'images': images})
+        return images
 
-        k = len(entries)
-        print(f'{k} entries.')
-        return filehashes
-
-    def save(self):
+    def save(self, max_workers=None, max_per_host=None, incremental=None):
         # Backup the main rss feed / json feed dump
+        # max_workers > 1 downloads the entries' assets in parallel, while
+        # max_per_host caps the parallel downloads from any one server
+        # for this feed (the shared client's limit still applies).
+        # incremental=False walks every entry again, not only new ones.
+        max_workers = max_workers or self.max_workers
+        if incremental is not None:
+            self.incremental = incremental
+        self._host_slots = httpclient.HostSlots(max_per_host)
 
         # Make the archive; save the xml and json converted plus entries mp3
         # FIXME: save other media
-        self.rss_xml = requests.get(self.rss_url)
-        self.rss_json = feedparser.parse(self.rss_url)
-
-        # these are all entries of the show; all episodes
-        entries = self.rss_json['entries']
+        entries = self.fetch()
+        if entries is None:
+            return None
         # Walk through every RSS entry one by one, get file hashes
-        filehashes = self._walk_entries(entries)
+        filehashes = self._walk_entries(entries, max_workers)
+        return self.finalize(entries, filehashes)
+
+    # save() in three steps, so a caller running many feeds (see
+    # scheduler.py) can push the entries of all of them through one pool:
+    #   entries = feed.fetch()
+    #   futures = feed.submit_entries(entries, pool)
+    #   feed.finalize(entries, feed.collect(entries, futures))
+
+    def fetch(self):
+        # Fetch and parse the feed; its entries, or None if not modified.
+        # the feed is fetched once; the same bytes are parsed and archived
+        headers = self._conditional_headers(self.rss_url)
+        self.rss_xml = self.http.get(self.rss_url, headers=headers)
+        if self.rss_xml.status_code == 304:
+            log.info(f'Feed not modified since last run: {self.rss_url}')
+            return None
+        self.rss_xml.raise_for_status()
+        # content-location lets feedparser resolve relative links as before
+        # feedparser only reads lower case header names
+        response_headers = {
+            k.lower(): v for k, v in self.rss_xml.headers.items()}
+        response_headers['content-location'] = self.rss_url
+        import feedparser
+        self.rss_json = feedparser.parse(
+            self.rss_xml.content, response_headers=response_headers)
 
-        today = TODAY_ISO_NAME
-        rss_url_name_xml = self._autoname(self.rss_url, today, ext='xml')
-        rss_url_name_json = self._autoname(self.rss_url, today, ext='json')
-        rss_filehashes_json = self._autoname('filehashes', today, ext='json')
+        # these are all entries of the show; all episodes
+        return self.rss_json['entries']
+
+    def submit_entries(self, entries, executor):
+        # One future per entry on a caller owned executor. _walk_entry
+        # never waits on the executor itself, so sharing a bounded pool
+        # between feeds can't deadlock.
+        return [executor.submit(self._process_entry, i) for i in entries]
+
+    def collect(self, entries, futures):
+        # Merged file hashes once every future is done; re-raises the
+        # first failure only after all of them finished
+        wait(futures)
+        return self._merge_entries(entries, [_.result() for _ in futures])
+
+    def finalize(self, entries, filehashes):
+        # Snapshot the feed, then trust its validators for the next run
+        today = date.today().strftime('%Y%m%d')
+        rss_url_name_xml = os.path.join(
+            self.outpath, self._autoname(self.rss_url, today, ext='xml'))
+        rss_url_name_json = os.path.join(
+            self.outpath, self._autoname(self.rss_url, today, ext='json'))
+        rss_filehashes_json = os.path.join(
+            self.outpath, self._autoname('filehashes', today, ext='json'))
 
         # force these to backup new everytime
-        self.dump_file(self.rss_xml, rss_url_name_xml)
+        self.dump_file(self.rss_xml.content, rss_url_name_xml)
         self.dump_file(self.rss_json, rss_url_name_json)
         self.dump_file(filehashes, rss_filehashes_json)
+        # only trust the feed validators once every entry made it to disk
+        self._remember_validators(self.rss_url, self.rss_xml)
+        self.close()
 
-        last_title = entries[0]['title']
-        log.info(f'Last entry: {last_title}')
+        if entries:
+            last_title = entries[0]['title']
+            log.info(f'Last entry: {last_title}')
+        return filehashes
+
+    def close(self):
+        # Flush the stores; after a failed run the feed validators are
+        # left alone, so the next run fetches the feed again
+        self.manifest.close()
+        self.artwork.close()
+        self.entries.close()
+        self.validators.close()
 
 
 # {'links':
@@ -250,37 +548,104 @@ class FeedParser:
 # 'base': 'https://eprint.iacr.org/rss/rss.xml', 'value': "..."},
 # 'id': 'https://eprint.iacr.org/2022/509', 'guidislink': False}
 class IACRFeedParser (FeedParser):
-    def _walk_entries(self, entries):
-        filehashes = {}
-        for i in entries:
-            title = i['title']
+    def _walk_entry(self, i):
+        title = i['title']
 
-            # save linked document
-            url = i['link']
-            url_pdf = f"{url}.pdf"
+        # save linked document
+        url = i['link']
+        url_pdf = f"{url}.pdf"
 
-            pub_year, pub_k = url.split('/')[-2:]
+        pub_year, pub_k = url.split('/')[-2:]
 
-            fn = self._autoname(f'{title}')
-            fn_path = os.path.join(self.outpath, pub_year)
-            fn_json = os.path.join(fn_path, 'json', f'{pub_k}-{fn}.json')
-            fn_pdf = os.path.join(fn_path, 'pdf', f'{pub_k}-{fn}.pdf')
+        fn = self._autoname(f'{title}')
+        fn_path = os.path.join(self.outpath, pub_year)
+        fn_json = os.path.join(fn_path, 'json', f'{pub_k}-{fn}.json')
+        fn_pdf = os.path.join(fn_path, 'pdf', f'{pub_k}-{fn}.pdf')
 
-            filehashes = {
-                'pdf': {'sha256': self.download(url_pdf, fn_pdf)},
-                'json': {'sha256': self.dump_file(i, fn_json)}
-            }
-        k = len(entries)
-        log.info(f'{k} entries.')
+        filehashes = {
+            fn_pdf: {'url': url_pdf, 'sha256': self.download(url_pdf, fn_pdf)},
+            fn_json: {'url': url, 'sha256': self.dump_file(i, fn_json)},
+        }
         return filehashes
 
+    def mirror(self, year_from, year_to=None, max_workers=4, rate=2):
+        # Bulk mirror every eprint published year_from..year_to (default:
+        # this year), not just the ones in the rss window. Papers are
+        # listed page by page through OAI-PMH and archived like rss
+        # entries, max_workers at a time and at most `rate` requests a
+        # second. Interrupted? Run it again: the listing resumes from the
+        # last finished page (mirror.jsonl) and papers already archived
+        # are skipped (entries.jsonl). Returns (archived, failed).
+        year_to = year_to or date.today().year
+        # a polite client of our own for this run; the shared one may be
+        # tuned for speed, and save() keeps using that one after us
+        shared_http = self.http
+        self.http = httpclient.HttpClient(rate=rate, max_per_host=max_workers)
+        checkpoint = JsonlStore(os.path.join(self.outpath, 'mirror.jsonl'))
+        try:
+            return self._mirror(year_from, year_to, max_workers, checkpoint)
+        finally:
+            self.http.session.close()
+            self.http = shared_http
+            checkpoint.close()
+            self.close()
+
+    def _mirror(self, year_from, year_to, max_workers, checkpoint):
+        key = f'{year_from}-{year_to}'
+        token = (checkpoint.get(key) or {}).get('token')
+        # a paper's records only change after it came out, so listing
+        # from year_from on sees all of them
+        from_date = f'{year_from}-01-01'
+        n_done = n_failed = 0
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            while True:
+                try:
+                    records, next_token = iacr.list_records(
+                        token, from_date, client=self.http)
+                except iacr.OAIError as error:
+                    if token and error.code == 'badResumptionToken':
+                        log.warning('Resumption token expired, listing again')
+                        token = None
+                        continue
+                    raise
+                records = [_ for _ in records
+                           if self._in_years(_, year_from, year_to)]
+                futures = {pool.submit(self._process_entry, _): _['link']
+                           for _ in records}
+                for future in as_completed(futures):
+                    try:
+                        future.result()
+                        n_done += 1
+                    except Exception as error:
+                        # eg. withdrawn papers; retried on the next pass
+                        log.error(f'{futures[future]}: {error}')
+                        n_failed += 1
+                if not next_token:
+                    # listing complete; the next run starts over, picking
+                    # up new papers and whatever failed
+                    checkpoint.delete(key)
+                    break
+                checkpoint.put(key, {'token': next_token})
+                token = next_token
+                log.info(f'{n_done} papers archived, {n_failed} failed')
+        return n_done, n_failed
+
+    def _in_years(self, record, year_from, year_to):
+        _id = iacr.eprint_id(record['link'])
+        if not _id:
+            log.warning(f"Skipping record without an eprint id: "
+                        f"{record.get('oai_identifier')}")
+            return False
+        return year_from <= int(_id.split('/')[0]) <= year_to
+
+
+def parser_for(url):
+    # the FeedParser class that understands a feed url
+    return IACRFeedParser if 'eprint.iacr.org' in url else FeedParser
+
 
 if __name__ == "__main__":
-    # Backup the entire zeroknowledge podcast feed
-    furl = 'https://feeds.fireside.fm/zeroknowledge/rss'
-    furl = sys.argv[1] if len(sys.argv) > 1 else furl
-    feed = IACRFeedParser(furl, quiet=False)
-    feed.save()
-
-    # XML for this feed is different from zk rss
-    # furl = 'https://eprint.iacr.org/rss/rss.xml'
+    # same as `python -m zktools archive [feed_url]`; also runs as
+    # `python -m zktools.rssdump` or `python zktools/rssdump.py`
+    from .cli import main
+    sys.exit(main(['archive'] + sys.argv[1:]))
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# coding: utf-8
+# License: MIT
+# Author: Chris Ward <chris@zeroknowledge.fm>
+# Archive many rss feeds, each on its own schedule, with one worker budget
+__app_name__ = "FeedScheduler"
+__version__ = "0.1"
+'''
+0.1: per feed poll intervals and state, one shared download pool
+'''
+
+# Instead of one cron job per feed, all competing for bandwidth:
+#
+#   sched = FeedScheduler('feeds.jsonl', max_workers=8, max_per_host=4)
+#   sched.add('https://feeds.fireside.fm/zeroknowledge/rss', interval=6 * HOUR)
+#   sched.add('https://eprint.iacr.org/rss/rss.xml', interval=DAY)
+#   sched.run_forever()  # or sched.run_once() from cron
+#
+# Every feed's entries go through the same bounded thread pool, and every
+# request through the shared http client, so total and per host
+# concurrency stay fixed however many feeds are due at once.
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import httpclient
+from . import rssdump
+from .store import JsonlStore
+
+import logging
+log = logging.getLogger(__name__)
+
+HOUR = 60 * 60
+DAY = 24 * HOUR
+# a feed that failed is retried after this long, or its interval if shorter
+RETRY_INTERVAL = 15 * 60
+
+
+class Feed:
+    def __init__(self, url, interval=DAY, parser=None, out_dir='./'):
+        self.url = url
+        self.interval = interval
+        self.parser = parser or rssdump.parser_for(url)
+        self.out_dir = out_dir
+
+    def __repr__(self):
+        return f'Feed({self.url!r}, interval={self.interval})'
+
+
+class FeedScheduler:
+    # state_path keeps, per feed url: when it was last polled, how that
+    # went and the GUIDs of the entries it had. HTTP validators stay in
+    # each feed's own {outpath}/validators.jsonl.
+    def __init__(self, state_path='feeds.jsonl', max_workers=8,
+                 max_per_host=4, rate=None):
+        self.feeds = []
+        self.state = JsonlStore(state_path)
+        self.max_workers = max_workers
+        # the scheduler owns the process; set the shared limits up front
+        httpclient.configure(rate=rate, max_per_host=max_per_host)
+
+    def add(self, url, interval=DAY, parser=None, out_dir='./'):
+        feed = Feed(url, interval, parser, out_dir)
+        self.feeds.append(feed)
+        return feed
+
+    def next_poll(self, feed):
+        rec = self.state.get(feed.url)
+        if not rec:
+            return 0
+        if rec['status'] == 'error':
+            return rec['polled'] + min(feed.interval, RETRY_INTERVAL)
+        return rec['polled'] + feed.interval
+
+    def due(self, now=None):
+        now = time.time() if now is None else now
+        return [_ for _ in self.feeds if self.next_poll(_) <= now]
+
+    def run_once(self, now=None):
+        # Poll every due feed; {url: status}. Feeds are fetched one after
+        # the other while the entries of those already fetched download.
+        now = time.time() if now is None else now
+        feeds = self.due(now)
+        if not feeds:
+            return {}
+        jobs = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            for feed in feeds:
+                parser = feed.parser(feed.url, out_dir=feed.out_dir)
+                try:
+                    entries = parser.fetch()
+                except Exception as error:
+                    self._failed(feed, parser, now, error)
+                    continue
+                if entries is None:
+                    self._done(feed, now, 'not modified')
+                    parser.close()
+                    continue
+                futures = parser.submit_entries(entries, pool)
+                jobs.append((feed, parser, entries, futures))
+
+            for feed, parser, entries, futures in jobs:
+                try:
+                    filehashes = parser.collect(entries, futures)
+                    parser.finalize(entries, filehashes)
+                except Exception as error:
+                    self._failed(feed, parser, now, error)
+                    continue
+                self._done(feed, now, 'ok', entries, len(filehashes))
+        self.state.close()
+        return {_.url: self.state.get(_.url)['status'] for _ in feeds}
+
+    def _done(self, feed, now, status, entries=None, n_files=None):
+        rec = dict(self.state.get(feed.url) or {}, polled=now, status=status)
+        rec.pop('error', None)
+        if entries is not None:
+            guids = [_.get('id') or _.get('link') for _ in entries]
+            seen = set(rec.get('guids', []))
+            new = [_ for _ in guids if _ not in seen]
+            log.info(f'{feed.url}: {len(new)} new of {len(guids)} entries')
+            rec.update(guids=guids, new=len(new), files=n_files)
+        self.state.put(feed.url, rec)
+
+    def _failed(self, feed, parser, now, error):
+        log.error(f'{feed.url}: {error}')
+        parser.close()
+        rec = dict(self.state.get(feed.url) or {}, polled=now,
+                   status='error', error=str(error))
+        self.state.put(feed.url, rec)
+
+    def run_forever(self, min_sleep=1):
+        # Poll due feeds, then sleep until the next one is due
+        if not self.feeds:
+            log.warning('No feeds to schedule')
+            return
+        while True:
+            self.run_once()
+            wake = min(self.next_poll(_) for _ in self.feeds)
+            time.sleep(max(min_sleep, wake - time.time()))
@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# coding: utf-8
+# License: MIT
+# Author: Chris Ward <chris@zeroknowledge.fm>
+# Small persistent key/value stores shared by the tools
+__app_name__ = "Store"
+__version__ = "0.2"
+'''
+0.1: append-only json lines store
+0.2: ttl / lru cache on top, shared cache dir
+'''
+
+import os
+import json
+import time
+import atexit
+import threading
+
+import logging
+log = logging.getLogger(__name__)
+
+
+class JsonlStore:
+    # Append-only JSON lines key/value store. Every put() appends one
+    # {"key": .., "value": ..} line; when loading, the last line for a key
+    # wins. Safe to share between threads.
+    def __init__(self, path):
+        self.path = path
+        self._data = {}
+        self._stale = 0  # superseded lines in the file, see compact()
+        self._fh = None
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # torn line from an interrupted write; skip it
+                    log.debug(f'Skipping bad line in {self.path}')
+                    self._stale += 1
+                    continue
+                key = rec['key']
+                if key in self._data:
+                    self._stale += 1
+                    del self._data[key]
+                if rec.get('deleted'):
+                    self._stale += 1
+                else:
+                    self._data[key] = rec['value']
+
+    def _append(self, rec):
+        if self._fh is None:
+            save_path = os.path.dirname(self.path)
+            if save_path:
+                os.makedirs(save_path, exist_ok=True)
+            self._fh = open(self.path, 'a')
+        self._fh.write(json.dumps(rec) + '\n')
+        self._fh.flush()
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def put(self, key, value):
+        with self._lock:
+            # re-insert so iteration order follows last write
+            if self._data.pop(key, None) is not None:
+                self._stale += 1
+            self._data[key] = value
+            self._append({'key': key, 'value': value})
+
+    def delete(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is None:
+                return
+            self._stale += 2  # the old value plus the tombstone
+            self._append({'key': key, 'deleted': True})
+
+    def touch(self, key):
+        # Mark key as recently used; the order is persisted by compact()
+        with self._lock:
+            if key in self._data:
+                self._data[key] = self._data.pop(key)
+
+    def trim(self, max_len):
+        # Drop the least recently written / touched keys beyond max_len
+        while len(self._data) > max_len:
+            self.delete(next(iter(self._data)))
+
+    def keys(self):
+        return list(self._data)
+
+    def items(self):
+        return list(self._data.items())
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def compact(self):
+        # Rewrite the file with only the live records
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+            tmp_path = f'{self.path}.tmp'
+            with open(tmp_path, 'w') as f:
+                for key, value in self._data.items():
+                    f.write(json.dumps({'key': key, 'value': value}) + '\n')
+            os.replace(tmp_path, self.path)
+            self._stale = 0
+
+    def close(self):
+        # Flush to disk, compacting once most of the file is dead lines
+        if self._stale > len(self._data):
+            self.compact()
+        with self._lock:
+            if self._fh is not None:
+                self._fh.close()
+                self._fh = None
+
+
+class TtlCache:
+    # Persistent cache of json values. Each lookup passes its own max age
+    # (ttl seconds, None = never expires); beyond max_entries the least
+    # recently used keys are evicted.
+    def __init__(self, path, max_entries=10000):
+        self.max_entries = max_entries
+        self._store = JsonlStore(path)
+
+    def get(self, key, ttl=None):
+        rec = self._store.get(key)
+        if rec is None:
+            return None
+        if ttl is not None and time.time() - rec['ts'] > ttl:
+            return None
+        self._store.touch(key)
+        return rec['value']
+
+    def put(self, key, value):
+        self._store.put(key, {'ts': time.time(), 'value': value})
+        self._store.trim(self.max_entries)
+
+    def close(self):
+        self._store.close()
+
+
+_cache_dir = None
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def cache_dir():
+    # $ZKTOOLS_CACHE_DIR, else $XDG_CACHE_HOME/zktools or ~/.cache/zktools
+    if _cache_dir:
+        return _cache_dir
+    if os.environ.get('ZKTOOLS_CACHE_DIR'):
+        return os.environ['ZKTOOLS_CACHE_DIR']
+    xdg = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(xdg, 'zktools')
+
+
+def set_cache_dir(path):
+    global _cache_dir
+    _cache_dir = path
+
+
+def get_cache(name, max_entries=10000):
+    # One shared TtlCache per name, stored as {cache_dir}/{name}.jsonl
+    with _caches_lock:
+        if name not in _caches:
+            path = os.path.join(cache_dir(), f'{name}.jsonl')
+            _caches[name] = TtlCache(path, max_entries)
+        return _caches[name]
+
+
+@atexit.register
+def _close_caches():
+    for cache in _caches.values():
+        cache.close()
@@ -4,52 +4,219 @@
 # Author: Chris Ward <chris@zeroknowledge.fm>
 # Simple tool for extracting printable title from a list of links
 __app_name__ = "Trascript"
-__version__ = "0.1"
+__version__ = "0.3"
 '''
 0.1: Convert transcript texts to srt
+0.2: Stream paragraphs to srt blocks; HH:MM:SS,mmm timestamps
+0.3: WebVTT; batch convert an rssdump archive in a process pool
 '''
 
 # DEBUG
 #from IPython.core.debugger import set_trace
 #######
 
+import io
+import os
 import re
+import sys
+import hashlib
+
+if __name__ == "__main__" and not __package__:
+    # run as a script (python zktools/transcript.py): load as part of the
+    # zktools package, so the relative imports below work
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    __package__ = 'zktools'
+from .store import JsonlStore
 
 import logging
-log_format = '>> %(message)s'
-logging.basicConfig(level=logging.DEBUG, format=log_format)
-log = logging.getLogger()
+log = logging.getLogger(__name__)
+
+# Anna Rose (00:00:05):
+# Welcome to Zero Knowledge...
+re_clip_start = re.compile(r'(\d\d):(\d\d):(\d\d)')
+re_clip_body = re.compile(r'\):\n?(.+)', re.S)  # all lines after '):'
+# the last clip has no next clip to end at
+LAST_CLIP_SECONDS = 5
+# transcripts as saved by rssdump: {pub_dt}_{fn}.txt
+re_transcript_name = re.compile(r'^\d{8}_.+\.txt$')
+
+
+def srt_timestamp(seconds):
+    # 3725.5 -> '01:02:05,500'
+    ms = int(round(seconds * 1000))
+    h, ms = divmod(ms, 3600 * 1000)
+    m, ms = divmod(ms, 60 * 1000)
+    s, ms = divmod(ms, 1000)
+    return f'{h:02d}:{m:02d}:{s:02d},{ms:03d}'
+
+
+def _lines(source):
+    # a whole transcript string, a file object or any iterable of lines
+    return io.StringIO(source) if isinstance(source, str) else source
+
+
+def iter_paragraphs(source):
+    # Blocks of text separated by blank lines, read line by line
+    block = []
+    for line in _lines(source):
+        line = line.rstrip('\r\n')
+        if line.strip():
+            block.append(line)
+        elif block:
+            yield '\n'.join(block)
+            block = []
+    if block:
+        yield '\n'.join(block)
+
+
+def iter_clips(source):
+    # (start seconds, end seconds, body) per timestamped paragraph; a clip
+    # ends where the next one starts, so we hold one clip back. Paragraphs
+    # without a timestamp are added to the clip before them.
+    clip = None
+    for paragraph in iter_paragraphs(source):
+        r = re_clip_start.search(paragraph)
+        if not r:
+            if clip:
+                clip[2] = f'{clip[2]}\n{paragraph}'
+            else:
+                log.debug(f'Skipping untimed paragraph: {paragraph[:40]}')
+            continue
+        h, m, s = (int(_) for _ in r.groups())
+        start = h * 3600 + m * 60 + s
+        body = re_clip_body.search(paragraph)
+        body = body.group(1) if body else paragraph[r.end():].lstrip('):\n ')
+        if clip:
+            yield _close_clip(clip, start)
+        clip = [start, None, body]
+    if clip:
+        yield _close_clip(clip, None)
+
+
+def _close_clip(clip, next_start):
+    start, _, body = clip
+    if next_start is None or next_start <= start:
+        next_start = start + LAST_CLIP_SECONDS
+    return start, next_start, body
+
+
+def iter_srt(source):
+    # SRT blocks, one string per clip, numbered from 1
+    for i, (start, end, body) in enumerate(iter_clips(source), 1):
+        yield f'{i}\n{srt_timestamp(start)} --> {srt_timestamp(end)}\n{body}\n\n'
+
+
+def write_srt(source, out):
+    # Convert a transcript (string, file or lines) to SRT written to out;
+    # memory use does not grow with the length of the transcript
+    for block in iter_srt(source):
+        out.write(block)
+
+
+def iter_vtt(source):
+    # WebVTT: same cues as SRT, '.' before the milliseconds
+    yield 'WEBVTT\n\n'
+    for i, (start, end, body) in enumerate(iter_clips(source), 1):
+        start = srt_timestamp(start).replace(',', '.')
+        end = srt_timestamp(end).replace(',', '.')
+        yield f'{i}\n{start} --> {end}\n{body}\n\n'
+
+
+def write_vtt(source, out):
+    for block in iter_vtt(source):
+        out.write(block)
+
+
+WRITERS = {'srt': write_srt, 'vtt': write_vtt}
+
+
+def convert_file(src, formats=('srt',)):
+    # Write {name}.srt (and/or .vtt) next to the {name}.txt transcript
+    outs = []
+    base = os.path.splitext(src)[0]
+    for fmt in formats:
+        out_path = f'{base}.{fmt}'
+        tmp_path = f'{out_path}.tmp'
+        with open(src, encoding='utf-8') as f_in, \
+                open(tmp_path, 'w', encoding='utf-8') as f_out:
+            WRITERS[fmt](f_in, f_out)
+        os.replace(tmp_path, out_path)
+        outs.append(out_path)
+    return outs
+
+
+def find_transcripts(root):
+    for dirpath, _, filenames in os.walk(root):
+        for name in sorted(filenames):
+            if re_transcript_name.match(name):
+                yield os.path.join(dirpath, name)
+
+
+def _hash_file(filename):
+    h_sha256 = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b''):
+            h_sha256.update(chunk)
+    return h_sha256.hexdigest()
+
+
+def _convert_job(src, formats):
+    # runs in a worker process
+    return convert_file(src, formats)
+
+
+def convert_archive(root, formats=('srt',), max_workers=None, force=False):
+    # Convert every transcript under an rssdump archive folder across a
+    # process pool. {root}/transcripts.jsonl remembers the sha256 of each
+    # source and the converter version we last converted it with; those
+    # are skipped unless force=True or an output file went missing.
+    state = JsonlStore(os.path.join(root, 'transcripts.jsonl'))
+    todo = {}
+    for src in find_transcripts(root):
+        key = os.path.relpath(src, root)
+        sha256 = _hash_file(src)
+        rec = state.get(key)
+        base = os.path.splitext(src)[0]
+        if (not force and rec and rec['sha256'] == sha256
+                and rec['version'] == __version__
+                and set(formats) <= set(rec['formats'])
+                and all(os.path.exists(f'{base}.{_}') for _ in formats)):
+            log.debug(f'... skipping {src} (unchanged)')
+            continue
+        todo[src] = (key, sha256, rec)
+
+    # multiprocessing is slow to import, only load it when needed
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    converted = []
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        futures = {
+            pool.submit(_convert_job, src, formats): src for src in todo}
+        for future in as_completed(futures):
+            src = futures[future]
+            key, sha256, rec = todo[src]
+            converted.extend(future.result())
+            done = set(formats)
+            if rec and rec['sha256'] == sha256:
+                done |= set(rec['formats'])
+            state.put(key, {
+                'sha256': sha256,
+                'version': __version__,
+                'formats': sorted(done),
+            })
+    state.close()
+    log.info(f'{len(todo)} transcripts converted')
+    return converted
+
 
 class Transcript:
     def __init__(self, txt):
         self._txt = txt
 
     def as_srt(self):
-        re_clip_start = re.compile(r'(\d\d:\d\d:\d\d)', re.I)
-        re_clip_body = re.compile(r'\):\n?(.+)', re.I)
-        titles = self._txt.split('\n\n')
-        clips = []
-        for i, _t in enumerate(titles):
-            _clip_start = re_clip_start.search(_t)
-            _clip_start = _clip_start.group(1)
-            _clip_end = '00:00:00' if not clips else clips[-1]['start_ts']
-            _clip_body = re_clip_body.search(_t)
-            _clip_body = _clip_body.group(1)
-            _clip = {'id': i, 'start_ts': _clip_start, 'end_ts': _clip_end, 'body': _clip_body}
-            clips.append(_clip)
-            if i > 0:
-                # ripple adjust starts and ends
-                clips[i-1]['end_ts'] = clips[i]['start_ts']
-
-        srt = ''
-        for c in clips:
-            start = c["start_ts"]
-            end = c["end_ts"]
-            body = c["body"]
-            _id = c["id"]
-            srt += f'{_id}\n{start} --> {end}\n{body}\n\n'
-
-        return srt
+        srt = io.StringIO()
+        write_srt(self._txt, srt)
+        return srt.getvalue()
 
 if __name__ == "__main__":
     print ("HELLO WORLD")
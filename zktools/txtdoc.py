@@ -9,63 +9,130 @@ __version__ = "0.1"
 0.1:
 '''
 
+import os
 import re
-from lxml import html
-from bs4 import BeautifulSoup
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
 import logging
-log_format = '>> %(message)s'
-logging.basicConfig(level=logging.DEBUG, format=log_format)
-log = logging.getLogger()
-
-import requests
-req_log = requests.logging.getLogger()
-req_log.setLevel(logging.WARNING)  # Quiet down request API calls to airtable
-
-
-def _github(line_in):
-    r = re.match(r'^((https?://)?github.com/(([^/ ]+)/?(([^ /]*))))', line_in)
+log = logging.getLogger(__name__)
+
+if __name__ == "__main__" and not __package__:
+    # run as a script (python zktools/txtdoc.py): load as part of the
+    # zktools package, so the relative imports below work
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    __package__ = 'zktools'
+from . import httpclient
+from . import htmlmeta
+from . import iacr
+from . import store
+
+DAY = 24 * 3600
+
+
+def _cached(cache, key, ttl, fetch, ok=None):
+    # value for key from the link cache (None = no cache), else fetch();
+    # a fetched value is only cached if ok(value) agrees
+    if cache is None:
+        return fetch()
+    value = cache.get(key, ttl)
+    if value is None:
+        value = fetch()
+        if ok is None or ok(value):
+            cache.put(key, value)
+    return value
+
+
+re_github = re.compile(r'^((https?://)?github.com/(([^/ ]+)/?(([^ /]*))))')
+re_twitter = re.compile(r'^((https?://)?twitter.com/([^/ ]+)/?([^ ]*))')
+re_zkfm = re.compile(r'^((https?://)?zeroknowledge.fm/([^/ ]+))')
+re_youtube = re.compile(r'^((https?://)?(youtu\.?be(.com)?)/?(\w+))')
+re_iacr = re.compile(r'^((https?://)?eprint.iacr.org/(.+))')
+# hostname of the url a line starts with, scheme optional
+re_line_host = re.compile(r'^(?:https?://)?([^/\s:?#|]+)', re.I)
+re_markdown_link = re.compile(r'\[([^\]]+)\]\((.+)\)')
+re_default_url = re.compile(r'^(((https?://)([^/ ]+))(/([^ ]+))?)')
+re_md_link_full = re.compile(r'(\[([^\]]+)\]\(([^\)]+)\))')  # markdown [.*](.*)
+re_twitter_handle = re.compile(r'((https?://)?twitter.com/([^/ ]+))')
+
+
+def _github(line_in, cache=None):
+    r = re_github.match(line_in)
     return line_in if not r else f'{r.group(0)} | @{r.group(3)} | Github'
 
 
-def _twitter(line_in):
-    r = re.search(r'^((https?://)?twitter.com/([^/ ]+)/?([^ ]*))', line_in)
+def _twitter(line_in, cache=None):
+    r = re_twitter.search(line_in)
     by = 'Tweet by ' if r and r.group(4) else ''
     return f'{r.group(0)} | {by}@{r.group(3)} | Twitter' if r else line_in
 
 
-def _zkfm(line_in):
-    r = re.search(r'^((https?://)?zeroknowledge.fm/([^/ ]+))', line_in)
-    title = scrape_html_title(r.group(0)) if r else ''
+def _zkfm(line_in, cache=None):
+    r = re_zkfm.search(line_in)
+    title = _cached(cache, f'html_title:{r.group(0)}', 30 * DAY,
+                    lambda: scrape_html_title(r.group(0))) if r else ''
     title = re.sub('- ZK Podcast$', '| ZK Podcast', title)
     title = re.sub('Episode', 'Ep', title)
     return f'{r.group(0)} | {title}' if r else line_in
 
 
-def _youtube(line_in):
-    r = re.match(r'^((https?://)?(youtu\.?be(.com)?)/?(\w+))', line_in)
+def _youtube(line_in, cache=None):
+    r = re_youtube.match(line_in)
     if r:
         url = r.group(1)
         vid = r.group(5)
-        title = scrape_yt_title(vid)
+        title = _cached(cache, f'yt_title:{vid}', 30 * DAY,
+                        lambda: scrape_yt_title(vid))
     return line_in if not r else f'{url} | {title}'
 
-def _iacr(line_in):
-    r = re.match(r'^((https?://)?eprint.iacr.org/(.+))', line_in)
+def _iacr(line_in, cache=None):
+    r = re_iacr.match(line_in)
     if not r:
         return line_in
     ed = r.group(3)
     url = line_in
-    title = scrape_iacr_param(line_in, 'citation_title')
-    authors = scrape_iacr_param(line_in, 'citation_author')
+    # one fetch for title and authors; papers never change, cache forever
+    data = _cached(cache, f'iacr:{url}', None,
+                   lambda: iacr.fetch_eprint(url).as_dict(),
+                   ok=lambda d: iacr.EprintMeta.from_dict(d).ok)
+    eprint = iacr.EprintMeta.from_dict(data)
+    title = eprint.title
+    authors = ', '.join(eprint.authors)
     return f'{url} | {title} by {authors} | IACR - {ed}'
 
+# line formatter per hostname; a line is dispatched on the host of the url
+# it starts with, or of its closest registered parent domain
+FORMATTERS = {
+    'github.com': _github,
+    'twitter.com': _twitter,
+    'zeroknowledge.fm': _zkfm,
+    'youtu.be': _youtube,
+    'youtube.com': _youtube,
+    'eprint.iacr.org': _iacr,
+}
+
+
+def register_formatter(hostname, formatter):
+    # formatter(line_in, cache=None) returns line_in when it can't help
+    FORMATTERS[hostname.lower()] = formatter
+
+
+def formatter_for(line_in):
+    r = re_line_host.match(line_in)
+    if not r:
+        return None
+    labels = r.group(1).lower().split('.')
+    for k in range(len(labels)):
+        f = FORMATTERS.get('.'.join(labels[k:]))
+        if f:
+            return f
+    return None
+
+
 def scrape_iacr_param(url, attr):
-    attrs = {'name': attr}
-    r = requests.get(url)
-    soup = BeautifulSoup(r.content, 'html.parser')
-    _items = soup.find_all(attrs=attrs)
-    items = ', '.join([x.get('content') for x in _items])
+    items = ', '.join(iacr.fetch_eprint(url).get_all(attr))
     return items
 
 #  def scrape_meta(vid, param=None): # we could return the whole json...
@@ -74,7 +141,7 @@ def scrape_yt_title(vid):
         "format": "json",
         "url": f"https://www.youtube.com/watch?v={vid}"}
     url = "https://www.youtube.com/oembed"
-    r = requests.get(url, params=params)
+    r = httpclient.get(url, params=params)
     r_json = r.json()
     param_out = 'No Title'
     param_out = r_json.get('title', param_out) if r else param_out
@@ -82,8 +149,13 @@ def scrape_yt_title(vid):
 
 
 def scrape_html_title(url):
-    r = requests.get(url)
-    title = html.fromstring(r.content).findtext('.//title')
+    # <title> from the page's <head>; full lxml parse only as a fallback
+    page = htmlmeta.fetch_meta(url)
+    title = page.title
+    if title is None and page.is_html():
+        from lxml import html
+        r = httpclient.get(url)
+        title = html.fromstring(r.content).findtext('.//title')
     title = title if title else 'No Title'
     title = re.sub(r'\s+', ' ', title).strip()
     return title
@@ -96,6 +168,7 @@ class TextDoc:
         self.lines_in = self.text_in.split('\n')
         self.lines_out = []
         self.text_out = ''
+        self._cache = None
 
     def get_links(self, as_text=False):
         re_link = re.compile(r'https?://[^\s]+', re.I)
@@ -105,16 +178,53 @@ class TextDoc:
         else:
             return links
 
-    def reformat_links(self, md=False, max_line_len=0):
+    def reformat_links(self, md=False, max_line_len=0, use_cache=True,
+                       max_workers=1):
+        # use_cache=False bypasses the persistent link cache
+        self.lines_out = list(self._reformat_lines(
+                self.lines_in, md, max_line_len, use_cache, max_workers))
+        self.text_out = '\n'.join(self.lines_out)
+        return self.text_out
+
+    @classmethod
+    def iter_reformat(cls, stream, md=False, max_line_len=0, use_cache=True,
+                      max_workers=1, lookahead=None):
+        # Reformat the lines of a file-like object (or any iterable of
+        # lines) lazily, yielding each one, in order, once resolved. With
+        # max_workers > 1 up to `lookahead` lines (default 4 per worker)
+        # are fetched ahead; memory stays bounded by that window.
+        #   for line in TextDoc.iter_reformat(sys.stdin): print(line)
+        doc = cls('')
+        lines = (_.rstrip('\r\n') for _ in stream)
+        return doc._reformat_lines(
+                lines, md, max_line_len, use_cache, max_workers, lookahead)
+
+    def _reformat_lines(self, lines, md, max_line_len, use_cache,
+                        max_workers=1, lookahead=None):
         mll = max_line_len
         if mll < 0:
             raise ValueError
-        self.lines_out = [
-                self._process_line(_, md) for _ in self.lines_in]
+        self._cache = store.get_cache('links') if use_cache else None
+        if max_workers > 1:
+            lookahead = lookahead or 4 * max_workers
+            return self._iter_concurrent(lines, md, mll, max_workers, lookahead)
+        return (self._format_line(_, md, mll) for _ in lines)
+
+    def _iter_concurrent(self, lines, md, mll, max_workers, lookahead):
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            pending = deque()
+            for line in lines:
+                pending.append(pool.submit(self._format_line, line, md, mll))
+                if len(pending) >= lookahead:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def _format_line(self, line_in, md, mll):
+        line_out = self._process_line(line_in, md)
         if mll > 0:
-            self.lines_out = [self._truncate(_, mll) for _ in self.lines_out]
-        self.text_out = '\n'.join(self.lines_out)
-        return self.text_out
+            line_out = self._truncate(line_out, mll)
+        return line_out
 
     def _truncate(self, string, length):
         string_out = string[:length-4]
@@ -122,7 +232,7 @@ class TextDoc:
 
     def _force_simple(self, line_in):
         # link is markdown? convert needed
-        r = re.search(r'\[([^\]]+)\]\((.+)\)', line_in)
+        r = re_markdown_link.search(line_in)
         if not r:
             line_out = line_in
         else:
@@ -132,15 +242,11 @@ class TextDoc:
         return line_out
 
     def _process_line(self, line_in, md):
-        line_in = re.sub('^\s+', '', line_in)
-        line_in = re.sub('\s+$', '', line_in)
+        line_in = line_in.strip()
         line_in = self._force_simple(line_in)
-        ps = [_github, _twitter, _zkfm, _youtube, _iacr]
-        for f in ps:
-            line_out = f(line_in)
-            if line_out != line_in:
-                break
-        else:
+        f = formatter_for(line_in)
+        line_out = f(line_in, self._cache) if f else line_in
+        if line_out == line_in:
             line_out = self._default(line_in, from_url=True)
 
         if md:
@@ -151,7 +257,7 @@ class TextDoc:
         return line_out
 
     def _default(self, line_in, from_url=True):
-        r = re.match(r'^(((https?://)([^/ ]+))(/([^ ]+))?)', line_in)
+        r = re_default_url.match(line_in)
         #r = re.match(r'^(1(2(3https?://)?(4[^/ ]+))(5/(6[^ ]+))?)', line_in)
         if not r:
             return line_in
@@ -166,7 +272,8 @@ class TextDoc:
             title = re.sub(r'[^\w\s.]', '', title)  # remove url param chars
             title = title.title()  # upcase title
         else:
-            title = scrape_html_title(r.group(1)) if r else ''
+            title = _cached(self._cache, f'html_title:{url}', 7 * DAY,
+                            lambda: scrape_html_title(url))
         return f'{url} | {title} | {domain}'
 
 class MarkdownDoc:
@@ -175,33 +282,65 @@ class MarkdownDoc:
         self.text_out = self.text_in
 
     def as_simple(self):
-        md_pat = re.compile(r'(\[([^\]]+)\]\(([^\)]+)\))')
-        matches = md_pat.search(self.text_out)
+        # Single left to right pass over the text. It gives the same result
+        # as the search-and-replace loop below as long as every '[' opens
+        # a markdown link; stray brackets can nest or overlap links, those
+        # (rare) texts still take the loop.
+        text, n = self._simplify(self.text_out)
+        if n != self.text_out.count('['):
+            text = self._as_simple_loop(self.text_out)
+        self.text_out = text
+        return self.text_out
+
+    def _simplify(self, text):
+        # Links on the first line are checked for twitter handles, all
+        # others become 'name - url'; the first occurrence of a link
+        # decides the text of its copies
+        first_nl = text.find('\n')
+        first_line_end = len(text) if first_nl < 0 else first_nl
+        replacements = {}
+
+        def _replace(matches):
+            full_match = matches.group(0)
+            if full_match not in replacements:
+                name = matches.group(2)
+                url = matches.group(3)
+                in_first_line = matches.end() <= first_line_end
+                replacements[full_match] = self._replace_inline(
+                        url, in_first_line) or f'{name} - {url}'
+            return replacements[full_match]
+
+        return re_md_link_full.subn(_replace, text)
+
+    def _as_simple_loop(self, text):
+        # quadratic: every link rescans the text and its first line
+        matches = re_md_link_full.search(text)
         while matches:
             full_match = matches.group(0)
             name = matches.group(2)
             url = matches.group(3)
-            replacement = self._replace_inline(full_match) or f'{name} - {url}'
-            self.text_out = self.text_out.replace(full_match, replacement)
-            matches = md_pat.search(self.text_out)
-        return self.text_out
-
-    def _replace_inline(self, line_in):
+            first_line = text.split('\n')[0]
+            in_first_line = re_md_link_full.search(first_line) is not None
+            replacement = self._replace_inline(
+                    url, in_first_line) or f'{name} - {url}'
+            text = text.replace(full_match, replacement)
+            matches = re_md_link_full.search(text)
+        return text
+
+    def _replace_inline(self, url, in_first_line):
         # this is VERY specific to the current way we expect the copy text 
         # we publish per episode to look
-        md_pat = re.compile(r'(\[([^\]]+)\]\(([^\)]+)\))')  # markdown [.*](.*)
-        k = len(md_pat.findall(self.text_out.split('\n')[0])) + 1
-        matches = md_pat.search(line_in)
         tw_hdl = ''
-        if matches and k > 1:
-            url = matches.group(3)
-            tw_pat = re.search(r'((https?://)?twitter.com/([^/ ]+))', url)
+        if in_first_line:
+            tw_pat = re_twitter_handle.search(url)
             if tw_pat:
                 tw_hdl = tw_pat.group(3)
         txt_out =  f'@{tw_hdl}' if tw_hdl else ''
         return txt_out
 
 if __name__ == "__main__":
+    from . import setup_logging
+    setup_logging(logging.DEBUG)
     txt = '''
 [@tarunchitra](https://twitter.com/tarunchitra) | Twitter
 [DevConnet AMS 2022](https://devconnect.org/)